@@ -0,0 +1,44 @@
+"""Add indexes for hot-path queries
+
+Revision ID: 7c8f339592af
+Revises: 779c60314129
+Create Date: 2026-10-18 09:30:12.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c8f339592af'
+down_revision: Union[str, None] = '779c60314129'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонки) - совпадают с Index в моделях, чтобы create_all и миграция давали одно и то же
+INDEXES = [
+    # Поиск темы по ключевым словам (resolve_topic)
+    ('ix_keywords_word', 'keywords', ['word']),
+    # Ключевые слова темы (add_keywords_to_topic)
+    ('ix_keywords_topic_id', 'keywords', ['topic_id']),
+    # Сущности по паре action/object
+    ('ix_entities_action_object', 'entities', ['action', 'object']),
+    # История сообщений пользователя
+    ('ix_messages_user_id_timestamp', 'messages', ['user_id', 'timestamp']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицы, но не может выполняться в транзакции.
+    # if_not_exists: таблицы и индексы могли уже создаться через Base.metadata.create_all при старте бэкенда.
+    # Если построение прервалось, Postgres оставляет невалидный индекс - его нужно удалить и повторить миграцию.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
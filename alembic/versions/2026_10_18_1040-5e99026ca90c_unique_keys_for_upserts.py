@@ -0,0 +1,66 @@
+"""Unique keys for upsert-based find-or-create
+
+Revision ID: 5e99026ca90c
+Revises: 7c8f339592af
+Create Date: 2026-10-18 10:40:37.802114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e99026ca90c'
+down_revision: Union[str, None] = '7c8f339592af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Пара с NULL должна конфликтовать так же, как пара без NULL; NULLS NOT DISTINCT появился только в Postgres 15
+REQUIREMENT_PAIR = [sa.text("coalesce(action, '')"), sa.text("coalesce(object, '')")]
+
+
+def upgrade() -> None:
+    # Дубликаты могли появиться при гонке параллельных вставок (в том числе пары с NULL, которые
+    # unique_action_object не считал равными). Оставляем строку с наименьшим id, ссылки переводим на неё
+    op.execute("""
+        DELETE FROM keywords a USING keywords b
+        WHERE a.topic_id = b.topic_id AND a.word = b.word AND a.id > b.id
+    """)
+    op.execute("""
+        CREATE TEMPORARY TABLE requirement_duplicates ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, min(id) OVER (PARTITION BY coalesce(action, ''), coalesce(object, '')) AS keep_id
+            FROM entity_requirements
+        ) ranked WHERE id <> keep_id
+    """)
+    op.execute("""
+        UPDATE entities SET entity_requirements_id = d.keep_id
+        FROM requirement_duplicates d WHERE entities.entity_requirements_id = d.id
+    """)
+    op.execute("DELETE FROM entity_requirements WHERE id IN (SELECT id FROM requirement_duplicates)")
+
+    # Индексы строятся без блокировки записи. Если между очисткой и построением успел появиться новый
+    # дубликат, построение упадёт, оставив невалидный индекс - его нужно удалить и повторить миграцию
+    with op.get_context().autocommit_block():
+        op.create_index('uix_keywords_topic_id_word', 'keywords', ['topic_id', 'word'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('uix_entity_requirements_action_object', 'entity_requirements', REQUIREMENT_PAIR,
+                        unique=True, postgresql_concurrently=True, if_not_exists=True)
+        # Выборку слов темы теперь обслуживает уникальный индекс (topic_id - его первая колонка)
+        op.drop_index('ix_keywords_topic_id', table_name='keywords', postgresql_concurrently=True, if_exists=True)
+
+    # IF EXISTS: таблица могла быть создана через Base.metadata.create_all уже без этого ограничения
+    op.execute("ALTER TABLE entity_requirements DROP CONSTRAINT IF EXISTS unique_action_object")
+
+
+def downgrade() -> None:
+    op.create_unique_constraint('unique_action_object', 'entity_requirements', ['action', 'object'])
+    with op.get_context().autocommit_block():
+        op.create_index('ix_keywords_topic_id', 'keywords', ['topic_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('uix_entity_requirements_action_object', table_name='entity_requirements',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('uix_keywords_topic_id_word', table_name='keywords',
+                      postgresql_concurrently=True, if_exists=True)
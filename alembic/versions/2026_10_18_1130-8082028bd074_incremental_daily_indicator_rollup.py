@@ -0,0 +1,51 @@
+"""Incremental rollup of indicator collections into daily indicators
+
+Revision ID: 8082028bd074
+Revises: 5e99026ca90c
+Create Date: 2026-10-18 11:30:54.129604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8082028bd074'
+down_revision: Union[str, None] = '5e99026ca90c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AGGREGATE_COLUMNS = [
+    sa.Column('value_sum', sa.Float(), nullable=True),
+    sa.Column('value_min', sa.Float(), nullable=True),
+    sa.Column('value_max', sa.Float(), nullable=True),
+    sa.Column('value_count', sa.Integer(), nullable=True),
+]
+
+
+def upgrade() -> None:
+    # if_not_exists: таблица и колонки могли уже создаться через Base.metadata.create_all при старте бэкенда
+    op.create_table(
+        'rollup_watermarks',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+        if_not_exists=True,
+    )
+    for column in AGGREGATE_COLUMNS:
+        op.add_column('daily_indicators', column, if_not_exists=True)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_indicator_collections_collection_time', 'indicator_collections', ['collection_time'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_indicator_collections_collection_time', table_name='indicator_collections',
+                      postgresql_concurrently=True, if_exists=True)
+    for column in reversed(AGGREGATE_COLUMNS):
+        op.drop_column('daily_indicators', column.name, if_exists=True)
+    op.drop_table('rollup_watermarks', if_exists=True)
@@ -0,0 +1,30 @@
+"""Mark manually set daily indicators so the rollup keeps their value
+
+Revision ID: 3f6b0c2d9e41
+Revises: 8082028bd074
+Create Date: 2026-10-18 15:00:12.481337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6b0c2d9e41'
+down_revision: Union[str, None] = '8082028bd074'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # if_not_exists: колонка могла уже создаться через Base.metadata.create_all при старте бэкенда.
+    # Существующие строки не отмечаются: их value без агрегатов, как и раньше, заменит среднее по замерам
+    op.add_column('daily_indicators',
+                  sa.Column('is_manual', sa.Boolean(), server_default=sa.false(), nullable=False),
+                  if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_column('daily_indicators', 'is_manual', if_exists=True)
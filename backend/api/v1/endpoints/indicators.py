@@ -1,3 +1,104 @@
-from fastapi import APIRouter
+from datetime import date
+from typing import List, Optional
+from uuid import UUID
 
-router = APIRouter()
\ No newline at end of file
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from db.session import get_async_session, async_session_maker
+from schemas.indicators_schema import IndicatorCreate, IndicatorSchema, IndicatorCollectionCreate, \
+    IndicatorCollectionSchema, DailyIndicatorCreate, DailyIndicatorSchema, IndicatorAnalyticsSchema
+from services.indicator_analytics import IndicatorAnalyticsService
+from services.indicator_rollup import daily_rollup
+from services.indicator_service import IndicatorService, IndicatorCollectionService, DailyIndicatorService
+
+router = APIRouter()
+
+@router.post("/", response_model=IndicatorSchema)
+async def create_indicator(indicator_data: IndicatorCreate, db: AsyncSession = Depends(get_async_session)):
+    try:
+        return await IndicatorService(db).create_indicator(indicator_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.post("/bulk", response_model=List[IndicatorSchema])
+async def create_indicators(indicators_data: List[IndicatorCreate], db: AsyncSession = Depends(get_async_session)):
+    """Создаёт пачку индикаторов одной транзакцией: при ошибке не сохраняется ни один"""
+    try:
+        return await IndicatorService(db).create_indicators(indicators_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.get("/", response_model=List[IndicatorSchema])
+async def read_indicators(db: AsyncSession = Depends(get_async_session)):
+    return await IndicatorService(db).get_all_indicators()
+
+@router.post("/collections", response_model=IndicatorCollectionSchema)
+async def create_indicator_collection(collection_data: IndicatorCollectionCreate,
+                                      db: AsyncSession = Depends(get_async_session)):
+    try:
+        return await IndicatorCollectionService(db).create_indicator_collection(collection_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.post("/collections/bulk", response_model=List[IndicatorCollectionSchema])
+async def create_indicator_collections(collections_data: List[IndicatorCollectionCreate],
+                                       db: AsyncSession = Depends(get_async_session)):
+    """Сохраняет пачку замеров одной транзакцией"""
+    try:
+        return await IndicatorCollectionService(db).create_indicator_collections(collections_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.get("/collections/user/{user_id}", response_model=List[IndicatorCollectionSchema])
+async def read_user_collections(user_id: UUID, db: AsyncSession = Depends(get_async_session)):
+    return await IndicatorCollectionService(db).get_collections_by_user(user_id)
+
+@router.put("/daily", response_model=DailyIndicatorSchema)
+async def upsert_daily_indicator(indicator_data: DailyIndicatorCreate, db: AsyncSession = Depends(get_async_session)):
+    """Записывает значение индикатора за день; повторная запись за тот же день перезаписывает значение"""
+    try:
+        return await DailyIndicatorService(db).upsert_daily_indicator(indicator_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.put("/daily/bulk", response_model=List[DailyIndicatorSchema])
+async def upsert_daily_indicators(indicators_data: List[DailyIndicatorCreate],
+                                  db: AsyncSession = Depends(get_async_session)):
+    """Записывает ежедневные индикаторы многих пользователей за один запрос к БД"""
+    try:
+        return await DailyIndicatorService(db).upsert_daily_indicators(indicators_data)
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+@router.get("/daily/user/{user_id}", response_model=List[DailyIndicatorSchema])
+async def read_user_daily_indicators(user_id: UUID, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                     db: AsyncSession = Depends(get_async_session)):
+    return await DailyIndicatorService(db).get_daily_indicators_by_user(user_id, date_from, date_to)
+
+@router.post("/daily/rollup")
+async def run_daily_rollup():
+    """Сразу агрегирует новые замеры в ежедневные индикаторы, не дожидаясь фоновой задачи"""
+    batches = await daily_rollup.run(async_session_maker)
+    return {"batches": batches, "stats": daily_rollup.stats()}
+
+@router.get("/daily/rollup/stats")
+async def get_daily_rollup_stats():
+    """Отметка и пропускная способность агрегации замеров в этом воркере"""
+    return daily_rollup.stats()
+
+@router.get("/analytics/user/{user_id}", response_model=List[IndicatorAnalyticsSchema])
+async def read_user_analytics(user_id: UUID, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                              window: int = Query(7, ge=1, le=settings.ANALYTICS_MAX_WINDOW),
+                              indicator_id: Optional[UUID] = None, db: AsyncSession = Depends(get_async_session)):
+    """Скользящее среднее, недельные и месячные агрегаты, серии и изменения по каждому индикатору пользователя"""
+    return await IndicatorAnalyticsService(db).get_user_analytics(user_id, date_from, date_to, window, indicator_id)
+
+@router.get("/{indicator_id}", response_model=IndicatorSchema)
+async def read_indicator(indicator_id: UUID, db: AsyncSession = Depends(get_async_session)):
+    indicator = await IndicatorService(db).get_indicator(indicator_id)
+    if indicator is None:
+        raise HTTPException(status_code=404, detail="Indicator not found")
+    return indicator
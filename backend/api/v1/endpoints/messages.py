@@ -2,12 +2,20 @@ import logging
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
 from uuid import UUID
 
 from schemas.message_schema import MessageSchema, MessageUpdate, MessageQueueInput
 from services.message_service import MessageService
-from db.session import get_async_session
-from utils.queue_manager import add_message_to_queue
+from db.session import get_async_session, pool_stats
+from services.nlp_executor import nlp_executor
+from services.queue_worker import queue_dispatcher
+from services.user_cache import user_cache
+from utils.db_metrics import message_statement_stats
+from utils.keyword_index import keyword_index
+from utils.reference_cache import reference_cache
+from utils.topic_batcher import topic_batcher
+from utils.queue_manager import add_message_to_queue, add_messages_to_queue
 
 
 router = APIRouter()
@@ -27,6 +35,28 @@ async def add_message_to_queue_route(message: MessageQueueInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/add_to_queue/bulk")
+async def add_messages_to_queue_route(messages: List[MessageQueueInput]):
+    """Добавляет пачку сообщений пользователей в очередь за один запрос к Redis"""
+    try:
+        added = await add_messages_to_queue(message.model_dump() for message in messages)
+        return {"status": "success", "detail": f"{added} messages added to queue"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/queue_stats")
+async def get_queue_stats():
+    """Возвращает загрузку обработчика очередей и пула NLP: выполняемые и ожидающие задачи"""
+    return {**queue_dispatcher.stats(), "nlp": nlp_executor.stats(), "keyword_index": keyword_index.stats(),
+            "reference_cache": reference_cache.stats(), "db_statements": message_statement_stats.stats(),
+            "user_cache": user_cache.stats(), "db_pool": pool_stats(), "topic_batcher": topic_batcher.stats()}
+
+@router.post("/reference_cache/invalidate")
+async def invalidate_reference_cache():
+    """Перечитывает промты и требования во всех воркерах после ручного изменения таблиц"""
+    await reference_cache.invalidate_all()
+    return {"status": "ok"}
+
 @router.put('/{message_id}', response_model=MessageSchema)
 async def update_message_value(message_data: MessageUpdate, db: AsyncSession = Depends(get_async_session)):
     """Обновляет сообщение по идентификатору (UUID)."""
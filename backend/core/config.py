@@ -11,8 +11,60 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     SYNC_DATABASE_URL: str
     DEBUG: bool = False
+    # Профиль движка БД. Размер пула подбирается под QUEUE_WORKER_CONCURRENCY и нагрузку API
+    DB_ECHO: bool = False  # Логировать каждый SQL-запрос (только для отладки)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10  # Дополнительные соединения сверх DB_POOL_SIZE при пиках
+    DB_POOL_TIMEOUT: float = 30.0  # Сколько ждать свободного соединения, с
+    DB_POOL_RECYCLE: int = 1800  # Пересоздавать соединения старше, с (-1 - никогда)
+    DB_POOL_PRE_PING: bool = True  # Проверять соединение перед выдачей из пула
+    DB_STATEMENT_CACHE_SIZE: int = 100  # Кэш подготовленных запросов asyncpg на соединение (0 - выключен, нужно для pgbouncer)
     OPENAI_API_CHAT_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None  # Например, адрес локальной заглушки для тестов
+    OPENAI_MODEL: str = "gpt-4o"
+    OPENAI_TIMEOUT: float = 30.0  # Общий таймаут запроса, с
+    OPENAI_CONNECT_TIMEOUT: float = 5.0
+    OPENAI_MAX_RETRIES: int = 2
+    OPENAI_MAX_CONCURRENCY: int = 16  # Одновременных запросов к OpenAI на процесс
     REDIS_URL: str
+    QUEUE_MAX_BATCH: int = 50  # Максимальное число сообщений, забираемых из очереди пользователя за раз
+    QUEUE_BATCH_PROCESSING: bool = True  # Обрабатывать порцию сообщений пользователя в одной сессии и транзакции
+    QUEUE_WORKER_CONCURRENCY: int = 8  # Сколько пользователей обрабатывается одновременно
+    QUEUE_SCHEDULER: str = "expiry"  # Таймер тишины для списков: "expiry" - TTL-ключи и keyspace-события, "zset" - сортированное множество
+    QUEUE_SCHEDULER_TICK_MS: int = 250  # Период опроса сортированного множества
+    NLP_PROFILE: str = "extraction"  # "extraction" - только компоненты для извлечения сущностей, "full" - вся модель
+    NLP_BATCH_SIZE: int = 64  # Размер пачки текстов для nlp.pipe
+    NLP_N_PROCESS: int = 1  # Число процессов spaCy для nlp.pipe
+    NLP_WORKERS: int = 2  # Число процессов пула извлечения сущностей (0 - разбор в процессе API)
+    NLP_MAX_PENDING: int = 100  # Максимум одновременно ожидающих задач пула
+    ENTITY_CACHE_SIZE: int = 10000  # Размер LRU-кэша извлечённых сущностей (0 - без кэша)
+    ENTITY_CACHE_REDIS: bool = True  # Общий для воркеров второй уровень кэша в Redis
+    ENTITY_CACHE_REDIS_TTL: int = 7 * 24 * 3600
+    USER_CACHE_SIZE: int = 10000  # Размер LRU-кэша пользователей по telegram_id (0 - только Redis)
+    USER_CACHE_LOCAL_TTL: float = 300  # Срок жизни записи в памяти процесса, с
+    USER_CACHE_REDIS_TTL: int = 24 * 3600
+    TOPIC_CACHE_TTL: int = 24 * 3600  # Срок хранения найденной темы для пары action/object, с
+    TOPIC_NEGATIVE_CACHE_TTL: int = 3600  # Срок хранения отрицательного ответа GPT, с
+    TOPIC_INDEX_ENABLED: bool = True  # Искать темы по префиксу и нечётко в индексе ключевых слов в памяти, если точного совпадения в БД нет
+    TOPIC_INDEX_MIN_CONFIDENCE: float = 0.8  # Минимальная уверенность префиксного/нечёткого совпадения
+    REFERENCE_CACHE_MAX_AGE: float = 300  # Перечитывать снимок промтов и требований не реже, с
+    TOPIC_BATCHING: bool = True  # Объединять запросы на определение темы в один запрос к GPT
+    TOPIC_BATCH_WINDOW_MS: int = 200  # Окно сбора запросов
+    TOPIC_BATCH_MAX_ITEMS: int = 20  # Отправлять раньше окна, если набралось столько наборов слов
+    QUEUE_BACKEND: str = "list"  # "list" - списки с таймером истечения, "stream" - Redis Streams с группой потребителей
+    QUEUE_STREAM_KEY: str = "user_messages"
+    QUEUE_STREAM_GROUP: str = "message_workers"
+    QUEUE_STREAM_MAXLEN: int = 100000  # Приблизительный предел длины стрима
+    QUEUE_STREAM_BLOCK_MS: int = 5000  # Сколько ждать новых сообщений в XREADGROUP
+    QUEUE_STREAM_CLAIM_IDLE_MS: int = 60000  # Через сколько неподтверждённое сообщение забирается другим потребителем
+    QUEUE_STREAM_MAX_DELIVERIES: int = 5  # После стольких доставок без подтверждения сообщение уходит в стрим отказов
+    QUEUE_STREAM_DEAD_LETTER_KEY: str = "user_messages_dead"
+    ROLLUP_ENABLED: bool = True  # Фоновая агрегация indicator_collections в daily_indicators
+    ROLLUP_INTERVAL: float = 60  # Период запуска агрегации, с
+    ROLLUP_LAG: float = 60  # Не брать замеры моложе, с: транзакции, которые их пишут, могут быть ещё не зафиксированы
+    ROLLUP_WINDOW_HOURS: float = 24  # Окно замеров, обрабатываемое одной транзакцией, ч
+    ANALYTICS_CACHE_TTL: int = 3600  # Срок хранения результата аналитики индикаторов, с
+    ANALYTICS_MAX_WINDOW: int = 365  # Максимальное окно скользящего среднего, дней
 
     class Config:
         env_file = ".env"
@@ -24,7 +76,7 @@ settings = Settings()
 logging.basicConfig(
     level=logging.ERROR,  # Уровень логирования (можно использовать INFO, DEBUG и др.)
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='core/backend_errors.log',  # Файл для записи логов
+    filename=os.path.join(os.path.dirname(__file__), 'backend_errors.log'),  # Файл для записи логов рядом с модулем
     filemode='a'  # Режим добавления в файл (append)
 )
 
@@ -4,10 +4,21 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from core.config import settings
+from utils.db_metrics import MeteredQueuePool, pool_metrics
 
 
-# Создание движка
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+# Создание движка; пул замеряет ожидание соединений (см. pool_stats)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.DB_ECHO,
+    poolclass=MeteredQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+)
 
 # Асинхронный session maker
 async_session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
@@ -15,4 +26,8 @@ async_session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncS
 # Получаем асинхронную сессию
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def pool_stats() -> dict:
+    """Состояние пула соединений: занятые, overflow, время ожидания и таймауты."""
+    return pool_metrics.stats(engine.sync_engine.pool)
@@ -7,15 +7,22 @@ from fastapi import FastAPI
 from sqlalchemy.ext.asyncio import AsyncSession, async_session
 
 from api.v1.endpoints import users, messages, indicators
-from db.session import engine, get_async_session
+from db.session import engine, get_async_session, async_session_maker
 from db.base import Base
 
 # Импорт всех моделей
 from models.user_models import UserModel
 from models.indicators_models import IndicatorModel, IndicatorCollectionModel, DailyIndicatorModel
 from models.message_models import MessageModel
-from services.queue_worker import check_expired_queues
+from core.config import settings
+from services.entity_service import warm_up_nlp
+from services.indicator_rollup import daily_rollup
+from services.nlp_executor import nlp_executor
+from services.queue_worker import check_expired_queues, consume_message_stream, poll_due_queues
+from utils.ai_utils import close_openai_client
+from utils.keyword_index import keyword_index
 from utils.redis_client import redis_client
+from utils.reference_cache import reference_cache
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -33,7 +40,24 @@ async def startup_event():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         # Получаем асинхронную сессию
-    asyncio.create_task(check_expired_queues())
+    # Модель нужна процессу API только при разборе в нём самом; процессы пула NLP загружают её
+    # через fork-сервер и прогревают сами
+    if settings.NLP_WORKERS <= 0:
+        print("Время компонентов spaCy при прогреве, мс:", warm_up_nlp())
+    nlp_executor.start()
+    async with async_session_maker() as db:
+        await reference_cache.load(db)
+        if settings.TOPIC_INDEX_ENABLED:
+            await keyword_index.load(db)
+    asyncio.create_task(reference_cache.listen(async_session_maker))
+    if settings.ROLLUP_ENABLED:
+        asyncio.create_task(daily_rollup.run_forever(async_session_maker, settings.ROLLUP_INTERVAL))
+    if settings.QUEUE_BACKEND == "stream":
+        asyncio.create_task(consume_message_stream())
+    elif settings.QUEUE_SCHEDULER == "zset":
+        asyncio.create_task(poll_due_queues())
+    else:
+        asyncio.create_task(check_expired_queues())
 
 
 @app.on_event("shutdown")
@@ -41,6 +65,8 @@ async def shutdown_event():
     # Закрытие соединения с базой данных
     await engine.dispose()
     await redis_client.close()
+    await close_openai_client()
+    nlp_executor.shutdown()
 
 
 # Настройте маршрут для проверки работы
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, UUID, ARRAY, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, UUID, ARRAY, JSON, Index, func, literal_column
 from sqlalchemy.orm import relationship
 from db.base import Base
 
 class EntityModel(Base):
     __tablename__ = "entities"
+    __table_args__ = (Index('ix_entities_action_object', 'action', 'object'),)
 
     message_id = Column(UUID(as_uuid=True), ForeignKey('messages.id', ondelete="CASCADE"), primary_key=True)  # Связь с сообщением
     action = Column(String, nullable=True)  # Действие, например, "гулял"
@@ -37,6 +38,11 @@ class Topic(Base):
 
 class Keyword(Base):
     __tablename__ = "keywords"
+    __table_args__ = (
+        Index('ix_keywords_word', 'word'),
+        # Цель ON CONFLICT при добавлении ключевых слов; заодно обслуживает выборку слов темы
+        Index('uix_keywords_topic_id_word', 'topic_id', 'word', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     word = Column(String, nullable=False)  # Ключевое слово для темы
@@ -54,4 +60,13 @@ class EntityRequirement(Base):
     required_fields = Column(ARRAY(String), nullable=True)
     questions = Column(JSON, nullable=True)
 
-    __table_args__ = (UniqueConstraint('action', 'object', name='unique_action_object'),)
\ No newline at end of file
+
+# Ключ пары с учётом NULL (Postgres 13 не поддерживает NULLS NOT DISTINCT). Пустая строка - текст SQL,
+# а не параметр: в общем плане подготовленного запроса $1 уже не совпадает с выражением индекса
+REQUIREMENT_PAIR_KEY = (
+    func.coalesce(EntityRequirement.action, literal_column("''")),
+    func.coalesce(EntityRequirement.object, literal_column("''")),
+)
+
+# Уникальность пары: цель ON CONFLICT в find_or_create_entity_requirement, поиск по паре идёт по тем же выражениям
+Index('uix_entity_requirements_action_object', *REQUIREMENT_PAIR_KEY, unique=True)
\ No newline at end of file
@@ -2,7 +2,8 @@ import uuid
 
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, String, Float, Date, DateTime, Index, ForeignKey, UniqueConstraint, func
+from sqlalchemy import Column, String, Float, Integer, Boolean, Date, DateTime, Index, ForeignKey, UniqueConstraint, \
+    func, false
 
 from db.base import Base
 
@@ -21,6 +22,8 @@ class IndicatorModel(Base):
 
 class IndicatorCollectionModel(Base):
     __tablename__ = 'indicator_collections'
+    # Выборка новых замеров по окну времени при агрегации в daily_indicators
+    __table_args__ = (Index('ix_indicator_collections_collection_time', 'collection_time'),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -43,8 +46,22 @@ class DailyIndicatorModel(Base):
     date = Column(Date, nullable=False, default=func.current_date())
     indicator_id = Column(UUID(as_uuid=True), ForeignKey('indicators.id'), nullable=False)
     value = Column(Float, nullable=True)
+    # Агрегаты замеров за день, поддерживаются инкрементальной агрегацией (value - среднее)
+    value_sum = Column(Float, nullable=True)
+    value_min = Column(Float, nullable=True)
+    value_max = Column(Float, nullable=True)
+    value_count = Column(Integer, nullable=True)
+    # Значение задано вручную: агрегация продолжает считать агрегаты замеров, но value не трогает
+    is_manual = Column(Boolean, nullable=False, default=False, server_default=false())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     user = relationship('UserModel', back_populates='daily_indicators')
-    indicator = relationship('IndicatorModel', back_populates='daily_indicators')
\ No newline at end of file
+    indicator = relationship('IndicatorModel', back_populates='daily_indicators')
+
+class RollupWatermarkModel(Base):
+    __tablename__ = 'rollup_watermarks'
+
+    name = Column(String, primary_key=True)  # Имя задачи агрегации
+    watermark = Column(DateTime, nullable=True)  # Замеры с collection_time не позже этой отметки уже учтены
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
\ No newline at end of file
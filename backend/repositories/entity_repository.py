@@ -1,10 +1,12 @@
 # backend/repositories/entity_repository.py
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
-from sqlalchemy import UUID, update, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import UUID, update, select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from models.entity_models import EntityModel, EntityRequirement
+from models.entity_models import EntityModel, EntityRequirement, REQUIREMENT_PAIR_KEY
+from utils.after_commit import run_after_commit
+from utils.reference_cache import reference_cache, RequirementSnapshot
 
 
 async def save_entity(db: AsyncSession, message_id: UUID, entity_data: dict, entity_requirements_id: int):
@@ -40,6 +42,36 @@ async def save_entity(db: AsyncSession, message_id: UUID, entity_data: dict, ent
         await db.rollback()  # Откат в случае ошибки
         raise
 
+async def save_entities(db: AsyncSession, entities: List[Tuple[UUID, dict, Optional[int]]]) -> None:
+    """
+    Сохраняет пачку сущностей одним INSERT в рамках текущей транзакции.
+
+    :param db: Сессия базы данных для асинхронных операций
+    :param entities: Список кортежей (message_id, entity_data, entity_requirements_id);
+                     тема уже известна, если в entity_data есть theme_id
+    """
+    if not entities:
+        return
+    rows = [
+        {
+            "message_id": message_id,
+            "action": entity_data.get("action"),
+            "object": entity_data.get("object"),
+            "specific_object": entity_data.get("specific_object"),
+            "location": entity_data.get("location"),
+            "quantity": entity_data.get("quantity"),
+            "size": entity_data.get("size"),
+            "conditions": entity_data.get("conditions"),
+            "duration": entity_data.get("duration"),
+            "time": entity_data.get("time"),
+            "date": entity_data.get("date"),
+            "theme_id": entity_data.get("theme_id"),
+            "entity_requirements_id": entity_requirements_id,
+        }
+        for message_id, entity_data, entity_requirements_id in entities
+    ]
+    await db.execute(insert(EntityModel), rows)
+
 async def update_entity_theme_id(db: AsyncSession, message_id: UUID, theme_id: int) -> None:
     """
     Обновляет поле theme_id для записи в таблице Entity.
@@ -55,25 +87,43 @@ async def update_entity_theme_id(db: AsyncSession, message_id: UUID, theme_id: i
     )
     await db.flush()
 
-async def find_or_create_entity_requirement(action: str, object_: str, db: AsyncSession) -> EntityRequirement:
-    # Проверяем, существует ли такая пара action-object в EntityRequirement
-    query = select(EntityRequirement).where(EntityRequirement.action == action, EntityRequirement.object == object_)
-    result = await db.execute(query)
-    requirement = result.scalar_one_or_none()
+async def get_entity_requirement(action: Optional[str], object_: Optional[str], db: AsyncSession) -> Optional[RequirementSnapshot]:
+    """Возвращает требования для пары action-object из снимка справочных данных, при промахе - из БД."""
+    requirement = reference_cache.get_requirement(action, object_)
+    if requirement is not None:
+        return requirement
+    result = await db.execute(
+        select(EntityRequirement).where(*_same_pair(action, object_))
+    )
+    requirement = result.scalars().first()
+    return reference_cache.put_requirement(requirement) if requirement else None
 
-    if not requirement:
-        # Если пары нет, создаем новую запись
-        requirement = EntityRequirement(action=action, object=object_, required_fields=[])
-        db.add(requirement)
-        try:
-            await db.flush()
-        except IntegrityError:
-            await db.rollback()
-            # Если запись уже существует, повторно выполняем запрос
-            result = await db.execute(query)
-            requirement = result.scalar_one_or_none()
-
-    return requirement
+def _same_pair(action: Optional[str], object_: Optional[str]) -> tuple:
+    """Условие на пару action-object в тех же выражениях, что и уникальный индекс (NULL равен NULL)."""
+    return REQUIREMENT_PAIR_KEY[0] == (action or ''), REQUIREMENT_PAIR_KEY[1] == (object_ or '')
+
+async def find_or_create_entity_requirement(action: str, object_: str, db: AsyncSession) -> RequirementSnapshot:
+    # Проверяем, существует ли такая пара action-object в EntityRequirement
+    requirement = await get_entity_requirement(action, object_, db)
+    if requirement:
+        return requirement
+
+    # Одним запросом вставляем пару или получаем уже существующую: параллельный воркер, вставивший её
+    # первым, не приводит ни к ошибке, ни к повтору. DO UPDATE без изменений нужен ради RETURNING -
+    # при DO NOTHING существующая строка не возвращается
+    stmt = pg_insert(EntityRequirement).values(action=action, object=object_, required_fields=[])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(REQUIREMENT_PAIR_KEY),
+        set_={"action": EntityRequirement.action},
+    ).returning(EntityRequirement)
+    requirement = await db.scalar(stmt, execution_options={"populate_existing": True})
+
+    # В снимок и остальным воркерам - только после коммита, иначе откат оставил бы в снимке несуществующий id
+    def on_commit():
+        reference_cache.put_requirement(requirement)
+        reference_cache.publish_requirement_change(action, object_)
+    run_after_commit(db, on_commit)
+    return RequirementSnapshot.from_model(requirement)
 
 async def check_missing_data_and_ask_questions(message_id: UUID, db: AsyncSession) -> Optional[Dict[str, str]]:
     """
@@ -96,22 +146,23 @@ async def check_missing_data_and_ask_questions(message_id: UUID, db: AsyncSessio
         return None
 
     # Получаем связанное требование для action и object сущности
-    result = await db.execute(
-        select(EntityRequirement).where(
-        EntityRequirement.action == entity.action,
-            EntityRequirement.object == entity.object
-        )
-    )
-    requirement = result.scalars().first()
+    requirement = await get_entity_requirement(entity.action, entity.object, db)
     print('Requirement - ', requirement)
     if not requirement:
         print(f"Требования для action '{entity.action}' и object '{entity.object}' не найдены.")
         return None
 
+    return missing_data_questions({field: getattr(entity, field) for field in requirement.required_fields}, requirement)
+
+def missing_data_questions(entity_data: dict, requirement: RequirementSnapshot) -> Optional[Dict[str, str]]:
+    """
+    Возвращает вопросы для обязательных полей, которых нет в извлечённых данных сущности.
+    Считается в памяти, без повторного чтения сущности из БД.
+    """
     # Проверяем значение required_fields перед определением недостающих полей
     print("Required fields in requirement:", requirement.required_fields)
     # Определяем недостающие обязательные поля
-    missing_fields = [field for field in requirement.required_fields if getattr(entity, field) is None]
+    missing_fields = [field for field in requirement.required_fields if entity_data.get(field) is None]
     print('MISSING FIELDS = ', missing_fields)
 
     # Формируем вопросы для недостающих полей
@@ -1,13 +1,17 @@
 # backend/repositories/message_repository.py
 
+import uuid
+from typing import List
+
 from fastapi import HTTPException
-from sqlalchemy import update
+from sqlalchemy import update, insert, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from uuid import UUID
 
 from models.message_models import MessageModel, PromptModel
 from schemas.message_schema import MessageUpdate, MessageSchema, MessageCreate
+from utils.reference_cache import reference_cache
 
 
 async def get_message_by_id(db: AsyncSession, message_id: UUID) -> MessageModel:
@@ -28,13 +32,28 @@ async def create_message(db: AsyncSession, message_data: MessageCreate) -> Messa
         await db.rollback()  # Откат транзакции в случае ошибки
         raise  # Повторный выброс ошибки для обработки выше по цепочке
 
+async def insert_message(db: AsyncSession, message_data: MessageCreate) -> UUID:
+    """Сохраняет сообщение одним INSERT ... RETURNING id, без refresh и повторного чтения строки."""
+    return await db.scalar(insert(MessageModel).values(**message_data.model_dump()).returning(MessageModel.id))
+
+async def create_messages(db: AsyncSession, messages_data: List[MessageCreate]) -> List[UUID]:
+    """Сохраняет пачку сообщений одним INSERT и возвращает их идентификаторы в исходном порядке."""
+    if not messages_data:
+        return []
+    message_ids = [uuid.uuid4() for _ in messages_data]
+    rows = [{"id": message_id, **message_data.model_dump()} for message_id, message_data in zip(message_ids, messages_data)]
+    await db.execute(insert(MessageModel), rows)
+    return message_ids
+
 async def update_message_token_usage(db: AsyncSession, message_update: MessageUpdate) -> None:
-    message = await get_message_by_id(db, message_update.id)
-    if message is None:
+    """Прибавляет потраченные токены к сообщению одним UPDATE, без предварительного чтения строки."""
+    result = await db.execute(
+        update(MessageModel)
+        .where(MessageModel.id == message_update.id)
+        .values(token_usage=func.coalesce(MessageModel.token_usage, 0) + (message_update.token_usage or 0))
+    )
+    if result.rowcount == 0:
         raise ValueError("Message not found")
-    message.token_usage = (message.token_usage or 0) + (message_update.token_usage or 0)
-    await db.flush()
-    await db.refresh(message)
 
 async def update_message_status_as_processed(db: AsyncSession, message_id: UUID) -> None:
     """Обновляет статус сообщения как обработанного."""
@@ -43,14 +62,19 @@ async def update_message_status_as_processed(db: AsyncSession, message_id: UUID)
         .where(MessageModel.id == message_id)
         .values(is_processed=True)
     )
-    await db.commit()
+    await db.flush()  # Фиксация остаётся за вызывающей транзакцией
 
 async def get_prompt_by_name(db: AsyncSession, name: str) -> str:
-    """Получает текст промта из таблицы PromptModel по его имени."""
+    """Получает текст промта из таблицы PromptModel по его имени. Сначала смотрит снимок справочных данных."""
+    content = reference_cache.get_prompt(name)
+    if content is not None:
+        return content
+
     result = await db.execute(select(PromptModel).where(PromptModel.name == name))
     prompt = result.scalars().first()
 
     if not prompt:
         raise HTTPException(status_code=404, detail="Промт не найден")
 
+    reference_cache.put_prompt(prompt.name, prompt.content)
     return prompt.content
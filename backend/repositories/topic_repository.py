@@ -1,17 +1,51 @@
 # backend/services/topic_repository.py
+import asyncio
+from typing import Iterable
 
 from sqlalchemy import select, UUID, text, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from models.entity_models import Topic, Keyword
 from repositories.message_repository import update_message_token_usage, get_prompt_by_name
 from schemas.message_schema import MessageUpdate
 from utils.ai_utils import analyze_text
+from utils.single_flight import SingleFlight
+from utils.topic_batcher import topic_batcher
+from core.config import settings
+from utils.topic_cache import get_cached_topic, cache_topic, queue_topic_cache_invalidation
+from utils.keyword_index import keyword_index, queue_index_update
 
+# Одновременные запросы к GPT по одному и тому же набору ключевых слов выполняются один раз
+topic_lookup_flight = SingleFlight("topic_lookup")
 
-async def find_or_create_topic(action: str, object_: str, message_id: UUID, db: AsyncSession) -> Topic | None:
+
+async def find_or_create_topic(action: str, object_: str, message_id: UUID, db: AsyncSession,
+                               prefetched: dict[tuple, tuple[str, int]] | None = None) -> Topic | None:
     """Ищет тему по ключевым словам в БД, если не находит, запрашивает у GPT и создает новую."""
-    # Убираем None из ключевых слов
-    keywords = [kw for kw in [action, object_] if kw]
+    topic, token_usage = await resolve_topic(action, object_, db, prefetched)
+    if token_usage:
+        await update_message_token_usage(db, MessageUpdate(id=message_id, token_usage=token_usage))
+        print("Обновление токенов в сообщении завершено")
+    return topic
+
+
+async def _find_known_topic(action: str, object_: str, keywords: list[str], db: AsyncSession) -> tuple[bool, Topic | None]:
+    """
+    Ищет тему без GPT: в кэше, в БД, в индексе ключевых слов.
+    Возвращает (известен ли ответ, тема): (True, None) - пара ранее признана нерелевантной.
+    Точные совпадения из общих кэша и БД проверяются раньше индекса: индекс у каждого процесса свой
+    и не видит слов, добавленных другими воркерами после его загрузки.
+    """
+    # Проверка кэша: найденная ранее тема или закэшированный отрицательный ответ GPT
+    cached = await get_cached_topic(action, object_)
+    if cached is not None:
+        if cached["id"] is None:
+            print(f"Пара {keywords} ранее признана нерелевантной, GPT не вызываем")
+            return True, None
+        topic = await db.get(Topic, cached["id"])
+        if topic:
+            return True, topic
     # Проверка существующей темы
     results = await db.execute(
         select(Topic)
@@ -21,67 +55,137 @@ async def find_or_create_topic(action: str, object_: str, message_id: UUID, db:
     topics = results.scalars().all()
     print('Topics - ', [t.name for t in topics])
     if topics:
-        return topics[0]
+        await cache_topic(action, object_, topics[0].id, topics[0].name)
+        return True, topics[0]
+    # Поиск в индексе ключевых слов в памяти: префиксное или нечёткое совпадение, точного в БД нет
+    if settings.TOPIC_INDEX_ENABLED and keyword_index.loaded:
+        match = keyword_index.lookup(keywords)
+        if match:
+            print(f"Тема {match.topic_name} найдена в индексе по слову {match.keyword} "
+                  f"({match.method}, уверенность {match.confidence:.2f})")
+            return True, await _attach_topic(db, match.topic_id, match.topic_name)
+    return False, None
 
-    # Если тема не найдена, выполняем запрос к GPT для определения новой темы
-    print("Тема не найдена, обращаемся к GPT")
-    prompt_text = f"По словам {', '.join(keywords)}. {await get_prompt_by_name(db, 'define_topic')}"
-    # Запрос к GPT
-    response_text, token_usage = await analyze_text(prompt_text)
+
+async def _ask_gpt(keywords: list[str], define_prompt: str, flush_now: bool) -> tuple[str, int]:
+    """
+    Запрашивает тему у GPT; параллельные запросы с теми же словами (в этом и других процессах) ждут один ответ.
+    Токены возвращаются только вызову, для которого GPT действительно вызывался.
+    """
+    async def ask():
+        if settings.TOPIC_BATCHING:
+            # Запрос уходит в GPT вместе с запросами других сообщений, токены делятся между ними
+            return await topic_batcher.classify(keywords, define_prompt, flush_now=flush_now)
+        return await analyze_text(f"По словам {', '.join(keywords)}. {define_prompt}")
+
+    (response_text, token_usage), is_leader = await topic_lookup_flight.do("|".join(sorted(keywords)), ask)
     print(f"Ответ от GPT: {response_text}, Потраченные токены: {token_usage}")
+    return response_text, token_usage if is_leader else 0
+
+
+async def prefetch_topic_answers(pairs: Iterable[tuple[str, str]], db: AsyncSession) -> dict[tuple, tuple[str, int]]:
+    """
+    Заранее спрашивает GPT о темах пар action/object, которых нет ни в кэше, ни в индексе, ни в БД.
+    Вызывать до открытия транзакции записи: окно TopicBatcher и ответ GPT не держат транзакцию и соединение.
+    Запросы уходят одновременно и попадают в одну пачку. Возвращает {(action, object): (ответ GPT, токены)}
+    для передачи в resolve_topic; пары, по которым GPT ответил ошибкой, resolve_topic спросит сам.
+    """
+    unknown = []
+    for action, object_ in dict.fromkeys(pairs):
+        keywords = [kw for kw in [action, object_] if kw]
+        if keywords and not (await _find_known_topic(action, object_, keywords, db))[0]:
+            unknown.append((action, object_, keywords))
+    if not unknown:
+        if db.in_transaction():
+            await db.rollback()
+        return {}
+    define_prompt = await get_prompt_by_name(db, 'define_topic')
+    # Здесь были только чтения: транзакция закрывается, соединение возвращается в пул до ответа GPT
+    if db.in_transaction():
+        await db.rollback()
+    print(f"Темы не найдены для {len(unknown)} пар, обращаемся к GPT")
+    answers = await asyncio.gather(
+        *[_ask_gpt(keywords, define_prompt, flush_now=False) for _, _, keywords in unknown], return_exceptions=True,
+    )
+    prefetched = {}
+    for (action, object_, _), answer in zip(unknown, answers):
+        if isinstance(answer, Exception):
+            print(f"Ошибка запроса темы для {action}/{object_} к GPT:", answer)
+        else:
+            prefetched[(action, object_)] = answer
+    return prefetched
+
 
-    # Обновление токенов в сообщении
-    await update_message_token_usage(db, MessageUpdate(id=message_id, token_usage=token_usage))
-    print("Обновление токенов в сообщении завершено")
+async def resolve_topic(action: str, object_: str, db: AsyncSession,
+                        prefetched: dict[tuple, tuple[str, int]] | None = None) -> tuple[Topic | None, int]:
+    """
+    Находит или создаёт тему, не трогая сообщение. Возвращает (тема, потраченные токены GPT),
+    чтобы вызывающий мог записать токены вместе с сообщением.
+    Ответ GPT берётся из prefetched (см. prefetch_topic_answers) и удаляется оттуда, чтобы токены
+    учлись один раз; без него GPT спрашивается сразу, без ожидания окна пачки - вызывающий держит транзакцию.
+    """
+    # Убираем None из ключевых слов
+    keywords = [kw for kw in [action, object_] if kw]
+    known, topic = await _find_known_topic(action, object_, keywords, db)
+    if known:
+        return topic, 0
+
+    # Если тема не найдена, берём заранее полученный ответ GPT или выполняем запрос
+    answer = prefetched.pop((action, object_), None) if prefetched is not None else None
+    if answer is None:
+        print("Тема не найдена, обращаемся к GPT")
+        define_prompt = await get_prompt_by_name(db, 'define_topic')
+        answer = await _ask_gpt(keywords, define_prompt, flush_now=db.in_transaction())
+    response_text, token_usage = answer
 
     # Если GPT вернул новую тему, создаем ее или добавляем к существующей
     if response_text != "False":
         topic_name = response_text.strip()
-        existing_topic = await db.scalar(select(Topic).where(Topic.name == topic_name))
-        if existing_topic:
-            print(f"Тема {topic_name} уже существует. Добавляем ключевые слова: {keywords}")
-            await add_keywords_to_topic(existing_topic.id, keywords, db)
-            return existing_topic
-        print(f"Создаем новую тему: {topic_name} с ключевыми словами: {keywords}")
+        # Тема и ключевые слова создаются вставками с ON CONFLICT: если тему с тем же именем уже создал
+        # другой воркер, к ней просто добавляются слова, без точки сохранения и повторного запроса
         topic = await create_topic_with_keywords(topic_name, keywords, db)
-        print(f"Новая тема добавлена: {topic}")
-        return topic
-    return None
+        print(f"Тема определена: {topic}")
+        return topic, token_usage
+    await cache_topic(action, object_, None, None)
+    return None, token_usage
+
+async def _attach_topic(db: AsyncSession, topic_id: int, topic_name: str) -> Topic:
+    """Привязывает тему, известную по индексу, к сессии без запроса к БД."""
+    topic = Topic(id=topic_id, name=topic_name)
+    make_transient_to_detached(topic)
+    return await db.merge(topic, load=False)
 
 async def add_keywords_to_topic(topic_id: int, keywords: list[str], db: AsyncSession):
     """Добавляет новые ключевые слова к существующей теме, избегая дубликатов."""
+    # Одинаковый порядок строк во всех воркерах - параллельные вставки ждут друг друга, а не взаимоблокируются
+    words = sorted({word for word in keywords if word})
+    if not words:
+        print("Новых ключевых слов для добавления нет.")
+        return
     try:
-        # Извлекаем существующие ключевые слова (множество строк)
-        result = await db.execute(select(Keyword.word).where(Keyword.topic_id == topic_id))
-        existing_keywords = set(result.scalars().all())
-
-        # Фильтруем ключевые слова, которые еще не добавлены
-        new_keywords = [Keyword(word=word, topic_id=topic_id) for word in keywords if
-                        word and word not in existing_keywords]
-
-        # Если есть новые ключевые слова, добавляем их
-        if new_keywords:
-            db.add_all(new_keywords)
-            await db.flush()  # Сохраняем без коммита
-            print(f"Добавлены новые ключевые слова для темы {topic_id}: {[kw.word for kw in new_keywords]}")
+        # Уже существующие слова пропускаются уникальным индексом, RETURNING отдаёт только вставленные
+        stmt = pg_insert(Keyword).values([{"word": word, "topic_id": topic_id} for word in words])
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Keyword.topic_id, Keyword.word]).returning(Keyword.word)
+        new_words = list((await db.scalars(stmt)).all())
+
+        if new_words:
+            queue_topic_cache_invalidation(db, new_words)
+            # Тема уже загружена вызывающим кодом, get берёт её из identity map
+            topic = await db.get(Topic, topic_id)
+            queue_index_update(db, new_words, topic_id, topic.name)
+            print(f"Добавлены новые ключевые слова для темы {topic_id}: {new_words}")
         else:
             print("Новых ключевых слов для добавления нет.")
 
     except Exception as e:
         print("Ошибка при добавлении ключевых слов:", e)
-        await db.rollback()  # Откат в случае ошибки
-        raise
+        raise  # Откат выполняет вызывающая транзакция
 
 async def create_topic_with_keywords(topic_name: str, keywords: list[str], db: AsyncSession) -> Topic:
-    """Создает новую тему и добавляет к ней указанные ключевые слова."""
-    new_topic = Topic(name=topic_name)
-    db.add(new_topic)
-    await db.flush()
-    for word in keywords:
-        if word:  # Добавляем только непустые ключевые слова
-            keyword = Keyword(word=word, topic_id=new_topic.id)
-            db.add(keyword)
-    await db.commit()
-    print(f"Создана новая тема: {new_topic.name} с ключевыми словами: {keywords}")
-    return new_topic
-
+    """Создает тему (или берёт существующую с тем же именем) и добавляет к ней указанные ключевые слова."""
+    # DO UPDATE без изменений нужен ради RETURNING - при DO NOTHING существующая строка не возвращается
+    stmt = pg_insert(Topic).values(name=topic_name)
+    stmt = stmt.on_conflict_do_update(index_elements=[Topic.name], set_={"name": Topic.name}).returning(Topic)
+    topic = await db.scalar(stmt, execution_options={"populate_existing": True})
+    await add_keywords_to_topic(topic.id, keywords, db)  # Фиксация остаётся за вызывающей транзакцией
+    return topic
@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from uuid import UUID
-from datetime import datetime, date
-from typing import Optional
+from datetime import datetime, date as Date  # Поле date в DailyIndicatorBase перекрывает имя типа в теле класса
+from typing import List, Optional
 
 class IndicatorBase(BaseModel):
     """Базовая схема для модели Indicator, содержащая общие поля."""
@@ -42,7 +42,7 @@ class IndicatorCollectionSchema(IndicatorCollectionBase):
 class DailyIndicatorBase(BaseModel):
     """Базовая схема для модели DailyIndicator, содержащая общие поля."""
     user_id: UUID
-    date: date = date.today()
+    date: Date = Field(default_factory=Date.today)  # Текущий день на момент запроса, а не запуска процесса
     indicator_id: UUID
     value: Optional[float] = None
 
@@ -53,8 +53,44 @@ class DailyIndicatorCreate(DailyIndicatorBase):
 class DailyIndicatorSchema(DailyIndicatorBase):
     """Схема, которая включает все поля модели DailyIndicator, включая id, и устанавливает orm_mode в True."""
     id: UUID
+    value_sum: Optional[float] = None
+    value_min: Optional[float] = None
+    value_max: Optional[float] = None
+    value_count: Optional[int] = None
+    is_manual: bool = False
     created_at: datetime = datetime.utcnow()
     updated_at: datetime = datetime.utcnow()
 
     class Config:
         from_attributes = True
+
+class AnalyticsSeries(BaseModel):
+    """Ряд индикатора по дням: значения, скользящее среднее и изменение к предыдущему непустому значению."""
+    date: List[Date]
+    value: List[Optional[float]]
+    rolling_avg: List[Optional[float]]
+    delta: List[Optional[float]]
+
+class AnalyticsBuckets(BaseModel):
+    """Агрегаты по неделям или месяцам: start - первый день периода."""
+    start: List[Date]
+    sum: List[float]
+    avg: List[float]
+    min: List[float]
+    max: List[float]
+    count: List[int]
+
+class AnalyticsStreak(BaseModel):
+    """Серии дней подряд со значением: current - серия, продолжающаяся до конца периода, иначе 0."""
+    current: int
+    longest: int
+    last_date: Optional[Date] = None
+
+class IndicatorAnalyticsSchema(BaseModel):
+    """Аналитика одного индикатора пользователя за период."""
+    indicator_id: UUID
+    series: AnalyticsSeries
+    weekly: AnalyticsBuckets
+    monthly: AnalyticsBuckets
+    streak: AnalyticsStreak
+    total_change: Optional[float] = None
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from core.config import settings
+from utils.redis_client import redis_client
+
+# Формат ключа: меняется вместе с нормализацией, чтобы не читать записи, сделанные по старым правилам
+_KEY_FORMAT = "v2"
+# Пунктуация по краям сообщения не влияет на сущности, внутри - может ("7:30"), её оставляем
+_EDGE_PUNCTUATION = " \t\n.,!?;:…-—\"'«»()"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к виду, в котором одинаковые по смыслу сообщения совпадают: схлопывает пробелы
+    и убирает пунктуацию по краям. Регистр сохраняется - quantity, size и location берутся из текста
+    токенов как есть, а распознавание мест зависит от заглавных букв.
+    """
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+def extractor_version() -> str:
+    """Версия извлечения: меняется вместе с правилами, моделью или профилем, и кэш сбрасывается."""
+    from services import entity_service  # импортирует spaCy, поэтому не при импорте модуля
+
+    # Версия пакета модели, а не загруженного конвейера: процесс API при NLP_WORKERS > 0 модель не загружает
+    model_version = entity_service.model_version()
+    return f"{entity_service.EXTRACTOR_VERSION}:{entity_service.NLP_MODEL}-{model_version}:{settings.NLP_PROFILE}"
+
+
+class EntityCache:
+    """
+    Кэш результатов extract_entities по нормализованному тексту.
+
+    Первый уровень - LRU в памяти процесса, второй (необязательный) - Redis, общий для всех воркеров.
+    Ключи содержат версию извлечения, поэтому после её смены старые записи не используются.
+    """
+
+    def __init__(self, max_size: int, use_redis: bool, redis_ttl: int):
+        self.max_size = max_size
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+        self._local: OrderedDict[str, dict] = OrderedDict()
+        self._version: Optional[str] = None
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"entities:{_KEY_FORMAT}:{self._version}:{digest}"
+
+    def _check_version(self):
+        version = extractor_version()
+        if version != self._version:
+            self._local.clear()
+            self._version = version
+
+    def _remember(self, key: str, entities: dict):
+        self._local[key] = entities
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def get_many(self, texts: List[str]) -> Dict[int, dict]:
+        """Возвращает найденные в кэше результаты по индексам текстов."""
+        self._check_version()
+        found: Dict[int, dict] = {}
+        redis_lookup: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            key = self._key(text)
+            if key in self._local:
+                self._local.move_to_end(key)
+                found[index] = dict(self._local[key])
+                self.local_hits += 1
+            else:
+                redis_lookup.setdefault(key, []).append(index)
+
+        if redis_lookup and self.use_redis:
+            keys = list(redis_lookup)
+            try:
+                redis = await redis_client.get_redis()
+                values = await redis.mget(keys)
+            except Exception as e:
+                print("Ошибка чтения кэша сущностей из Redis:", e)
+                values = [None] * len(keys)
+            for key, value in zip(keys, values):
+                if value is None:
+                    continue
+                entities = json.loads(value)
+                self._remember(key, entities)
+                for index in redis_lookup.pop(key):
+                    found[index] = dict(entities)
+                    self.redis_hits += 1
+
+        self.misses += sum(len(indexes) for indexes in redis_lookup.values())
+        return found
+
+    async def set_many(self, items: Dict[str, dict]):
+        """Сохраняет результаты извлечения для текстов в оба уровня кэша."""
+        self._check_version()
+        keyed = {self._key(text): entities for text, entities in items.items()}
+        for key, entities in keyed.items():
+            self._remember(key, dict(entities))
+        if keyed and self.use_redis:
+            try:
+                redis = await redis_client.get_redis()
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key, entities in keyed.items():
+                        pipe.set(key, json.dumps(entities, ensure_ascii=False), ex=self.redis_ttl)
+                    await pipe.execute()
+            except Exception as e:
+                print("Ошибка записи кэша сущностей в Redis:", e)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов."""
+        return {
+            "size": len(self._local),
+            "max_size": self.max_size,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "version": self._version,
+        }
+
+
+entity_cache = EntityCache(settings.ENTITY_CACHE_SIZE, settings.ENTITY_CACHE_REDIS, settings.ENTITY_CACHE_REDIS_TTL)
@@ -1,17 +1,96 @@
 # backend/services/entity_service.py
 import re
+import time
+from typing import Dict, Iterable, List, Optional
 
 import spacy
-from sqlalchemy import select
+from spacy.matcher import Matcher
+from spacy.strings import get_string_id
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
-from models.entity_models import EntityModel, EntityRequirement
-from repositories.entity_repository import save_entity
+from core.config import settings
+from models.entity_models import EntityModel
+from repositories.entity_repository import save_entity, get_entity_requirement
 from utils.redis_client import redis_client
 
-# Загрузка модели spaCy для русского языка
-nlp = spacy.load("ru_core_news_sm")
+NLP_MODEL = "ru_core_news_sm"
+# Версия правил извлечения: увеличивать при любом изменении результата extract_entities
+EXTRACTOR_VERSION = "2"
+# extract_entities читает только pos_ (morphologizer, attribute_ruler), lemma_ (lemmatizer по pos_)
+# и ent_type_ (ner), все они работают поверх общего tok2vec. Синтаксический разбор не используется.
+EXTRACTION_EXCLUDED_COMPONENTS = ("parser", "senter")
+# Предложения для прогрева модели при старте
+WARMUP_TEXTS = (
+    "Выпил чашку кофе без сахара в 7:30 утра.",
+    "Съел тарелку горохового супа в Москве.",
+    "Гулял в парке 30 минут.",
+)
+
+
+def load_nlp(profile: str = "extraction"):
+    """
+    Загружает модель spaCy.
+
+    Профиль "extraction" не загружает компоненты, которые не нужны для извлечения сущностей,
+    профиль "full" загружает модель целиком.
+    """
+    if profile == "full":
+        return spacy.load(NLP_MODEL)
+    return spacy.load(NLP_MODEL, exclude=list(EXTRACTION_EXCLUDED_COMPONENTS))
+
+
+def get_nlp():
+    """
+    Модель spaCy процесса и правила к ней загружаются при первом обращении, а не при импорте:
+    процесс API при NLP_WORKERS > 0 импортирует модуль, но разбор выполняют процессы пула.
+    """
+    global _nlp, _rule_matcher
+    if _nlp is None:
+        nlp = load_nlp(settings.NLP_PROFILE)
+        _rule_matcher = _build_rule_matcher(nlp.vocab)
+        _nlp = nlp
+    return _nlp
+
+
+def model_version() -> str:
+    """Версия установленного пакета модели - без загрузки конвейера."""
+    return spacy.util.get_package_version(NLP_MODEL) or ""
+
+
+def pipeline_info() -> dict:
+    """Компоненты загруженной в этом процессе модели и их время при последнем прогреве."""
+    return {
+        "pipeline": list(_nlp.pipe_names) if _nlp is not None else None,
+        "pipeline_timings_ms": dict(pipeline_timings),
+    }
+
+
+def warm_up_nlp(texts: Iterable[str] = WARMUP_TEXTS) -> Dict[str, float]:
+    """
+    Прогревает модель на примерах, чтобы первый запрос не был медленным,
+    и возвращает суммарное время работы каждого компонента в миллисекундах.
+    """
+    nlp = get_nlp()
+    timings = {"tokenizer": 0.0, **{name: 0.0 for name in nlp.pipe_names}}
+    for text in texts:
+        started = time.perf_counter()
+        doc = nlp.make_doc(text)
+        timings["tokenizer"] += (time.perf_counter() - started) * 1000
+        for name, component in nlp.pipeline:
+            started = time.perf_counter()
+            doc = component(doc)
+            timings[name] += (time.perf_counter() - started) * 1000
+    pipeline_timings.clear()
+    pipeline_timings.update({name: round(ms, 3) for name, ms in timings.items()})
+    return dict(pipeline_timings)
+
+
+# Модель spaCy для русского языка и правила количества, см. get_nlp
+_nlp = None
+_rule_matcher: Optional[Matcher] = None
+# Время компонентов при последнем прогреве, мс
+pipeline_timings: Dict[str, float] = {}
 
 # Допустимые единицы измерения для количества и времени
 quantity_units = {"кусок", "стакан", "чашка", "порция", "литр", "сигарета"}
@@ -20,7 +99,46 @@ time_units = {"минут", "час", "утра", "вечера"}
 
 def extract_entities(text: str) -> dict:
     """Извлекает действие, объект, место, количество и другие параметры из текста."""
-    doc = nlp(text)
+    return _entities_from_doc(get_nlp()(text))
+
+
+def extract_entities_batch(texts: Iterable[str], batch_size: Optional[int] = None,
+                           n_process: Optional[int] = None) -> List[dict]:
+    """
+    Извлекает сущности из множества текстов за один проход nlp.pipe.
+
+    Результат совпадает с вызовом extract_entities для каждого текста и идёт в том же порядке.
+    """
+    docs = get_nlp().pipe(
+        texts,
+        batch_size=batch_size or settings.NLP_BATCH_SIZE,
+        n_process=n_process or settings.NLP_N_PROCESS,
+    )
+    return [_entities_from_doc(doc) for doc in docs]
+
+
+def _build_rule_matcher(vocab) -> Matcher:
+    """Собирает правила для количества один раз при загрузке модели."""
+    matcher = Matcher(vocab)
+    units = sorted(quantity_units)
+    # "чашка кофе": единица измерения, за которой идёт существительное
+    matcher.add("QUANTITY", [[{"LEMMA": {"IN": units}}, {"POS": "NOUN"}]])
+    # "чашка кофе без сахара": то же, но с уточнением через "без"
+    matcher.add("QUANTITY_WITHOUT", [[{"LEMMA": {"IN": units}}, {"POS": "NOUN"}, {"LEMMA": "без"}, {}]])
+    return matcher
+
+
+# Идентификаторы правил - хэши их имён, одинаковые в любом словаре
+_QUANTITY = get_string_id("QUANTITY")
+_QUANTITY_WITHOUT = get_string_id("QUANTITY_WITHOUT")
+
+# Время ("7:30") и продолжительность ("30 минут") ищутся по всему тексту один раз
+TIME_PATTERN = re.compile(r"\b\d{1,2}[:.]\d{2}\b")
+DURATION_PATTERN = re.compile(r"\b\d+\s?(минут|час)\b")
+
+
+def _entities_from_doc(doc) -> dict:
+    """Разбирает уже обработанный spaCy документ в словарь сущностей за один проход по токенам."""
     entities = {
         "action": None,
         "object": None,
@@ -28,11 +146,22 @@ def extract_entities(text: str) -> dict:
         "location": None,
         "quantity": None,
         "size": None,
-        "conditions": None,
+        "conditions": None,  # Правил для условий и даты пока нет
         "duration": None,
         "time": None,
         "date": None,
     }
+    if not len(doc):
+        return entities
+
+    # Позиции единиц измерения, за которыми идёт существительное (и, возможно, "без ...")
+    quantity_starts = set()
+    without_starts = set()
+    for match_id, start, _ in _rule_matcher(doc):
+        if match_id == _QUANTITY:
+            quantity_starts.add(start)
+        elif match_id == _QUANTITY_WITHOUT:
+            without_starts.add(start)
 
     for i, token in enumerate(doc):
         # Определение действия (глагол)
@@ -41,46 +170,44 @@ def extract_entities(text: str) -> dict:
 
         # Проверка размера и объекта
         if token.pos_ == "NOUN":
-            prev_token = doc[i - 1] if i > 0 else None
-            next_token = doc[i + 1] if i + 1 < len(doc) else None
-
+            lemma = token.lemma_
             # Проверка на наличие размера перед объектом
-            if token.lemma_ in size_indicators and not entities["size"]:
-                entities["size"] = token.text
-                if next_token and next_token.pos_ == "NOUN":
-                    entities["object"] = next_token.lemma_
-
+            if lemma in size_indicators:
+                if not entities["size"]:
+                    entities["size"] = token.text
+                    next_token = doc[i + 1] if i + 1 < len(doc) else None
+                    if next_token and next_token.pos_ == "NOUN":
+                        entities["object"] = next_token.lemma_
             # Если слово - объект (существительное), но не `size`, сохраняем его
-            elif not entities["object"] and token.lemma_ not in size_indicators:
-                entities["object"] = token.lemma_
+            elif not entities["object"]:
+                entities["object"] = lemma
 
             # Если перед существительным стоит прилагательное (например, "гороховый суп")
-            if prev_token and prev_token.pos_ == "ADJ" and not entities["specific_object"]:
-                entities["specific_object"] = f"{prev_token.lemma_} {token.lemma_}"
-
-        # Условия с "без" или "с"
-        if token.lemma_ in quantity_units:
-            next_token = doc[i + 1] if i + 1 < len(doc) else None
-            if next_token and next_token.pos_ == "NOUN":
-                entities["object"] = next_token.lemma_
-                entities["quantity"] = token.text
-                if i + 2 < len(doc) and doc[i + 2].lemma_ == "без":
-                    entities["specific_object"] = f"{next_token.lemma_} без {doc[i + 3].lemma_}"
-
-        # Извлечение времени или даты через регулярное выражение
-        time_match = re.search(r"\b\d{1,2}[:.]\d{2}\b", text)
-        if time_match:
-            entities["time"] = time_match.group(0)
-
-        # Извлечение продолжительности
-        duration_match = re.search(r"\b\d+\s?(минут|час)\b", text)
-        if duration_match:
-            entities["duration"] = duration_match.group(0)
+            if i > 0 and not entities["specific_object"] and doc[i - 1].pos_ == "ADJ":
+                entities["specific_object"] = f"{doc[i - 1].lemma_} {lemma}"
+
+        # Количество и условия с "без"
+        if i in quantity_starts:
+            next_token = doc[i + 1]
+            entities["object"] = next_token.lemma_
+            entities["quantity"] = token.text
+            if i in without_starts:
+                entities["specific_object"] = f"{next_token.lemma_} без {doc[i + 3].lemma_}"
 
         # Определение места
         if token.ent_type_ == "LOC" or token.ent_type_ == "GPE":
             entities["location"] = token.text
 
+    # Извлечение времени
+    time_match = TIME_PATTERN.search(doc.text)
+    if time_match:
+        entities["time"] = time_match.group(0)
+
+    # Извлечение продолжительности
+    duration_match = DURATION_PATTERN.search(doc.text)
+    if duration_match:
+        entities["duration"] = duration_match.group(0)
+
     # Если `size` найдено, но объект нет, удаляем `size`
     if entities["size"] and not entities["object"]:
         entities["size"] = None
@@ -92,12 +219,7 @@ async def send_questions_to_user(entity: EntityModel, db: AsyncSession):
     Формирует и отправляет вопросы пользователю, основанные на недостающих полях сущности.
     """
     # 1. Получаем требования к обязательным полям для данной пары action и object
-    requirement = await db.execute(
-        select(EntityRequirement).where(
-            EntityRequirement.action == entity.action,
-            EntityRequirement.object == entity.object
-        )
-    ).scalars().first()
+    requirement = await get_entity_requirement(entity.action, entity.object, db)
 
     if not requirement:
         # Логируем случай, когда требования не найдены
@@ -0,0 +1,161 @@
+from datetime import date, timedelta
+from typing import List, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.indicators_models import DailyIndicatorModel
+from utils.analytics_cache import get_analytics_version, get_cached_analytics, cache_analytics
+
+
+def _to_list(values: np.ndarray) -> list:
+    """Массив в список для JSON: NaN становится None."""
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values, unit="D").tolist()
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def _rolling_mean(days: np.ndarray, values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Скользящее среднее за window календарных дней, заканчивающихся каждой датой ряда.
+    Пропущенные дни и пустые значения не участвуют в среднем; суммы окон - разности накопленных сумм.
+    """
+    if days.size == 0:
+        return np.empty(0)
+    offsets = days - days[0]
+    valid = ~np.isnan(values)
+    dense_sum = np.zeros(offsets[-1] + 2)
+    dense_count = np.zeros(offsets[-1] + 2)
+    dense_sum[offsets + 1] = np.where(valid, values, 0.0)
+    dense_count[offsets + 1] = valid
+    cum_sum, cum_count = np.cumsum(dense_sum), np.cumsum(dense_count)
+    start = np.maximum(offsets + 1 - window, 0)
+    window_sum = cum_sum[offsets + 1] - cum_sum[start]
+    window_count = cum_count[offsets + 1] - cum_count[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_count > 0, window_sum / window_count, np.nan)
+
+
+def _buckets(keys: np.ndarray, values: np.ndarray) -> dict:
+    """Сумма, среднее, минимум, максимум и количество по подряд идущим группам одинаковых ключей."""
+    if values.size == 0:
+        return {"start": [], "sum": [], "avg": [], "min": [], "max": [], "count": []}
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    counts = np.diff(np.append(starts, values.size))
+    sums = np.add.reduceat(values, starts)
+    return {
+        "start": _to_list(keys[starts]),
+        "sum": _to_list(sums),
+        "avg": _to_list(sums / counts),
+        "min": _to_list(np.minimum.reduceat(values, starts)),
+        "max": _to_list(np.maximum.reduceat(values, starts)),
+        "count": counts.tolist(),
+    }
+
+
+def compute_series_analytics(dates: np.ndarray, values: np.ndarray, window: int, streak_since: date) -> dict:
+    """
+    Аналитика одного ряда индикатора: скользящее среднее, изменения к предыдущему значению,
+    недельные (с понедельника) и месячные агрегаты, серии дней подряд со значением.
+
+    :param dates: Даты ряда (datetime64[D]), по возрастанию, без повторов
+    :param values: Значения (float64), NaN - день записан без значения
+    :param window: Окно скользящего среднего в календарных днях
+    :param streak_since: Самый ранний последний день, при котором серия ещё текущая; если последнее
+        значение записано раньше, текущая серия прервана и равна 0
+    """
+    days = dates.astype("int64")
+    valid = ~np.isnan(values)
+    valid_days, valid_values = days[valid], values[valid]
+
+    # Изменение к предыдущему непустому значению, в позициях исходного ряда
+    delta = np.full(values.size, np.nan)
+    delta[np.flatnonzero(valid)[1:]] = np.diff(valid_values)
+
+    # 1970-01-01 - четверг: сдвиг (day + 3) % 7 даёт номер дня недели с понедельника
+    week_start = (valid_days - (valid_days + 3) % 7).astype("datetime64[D]")
+    month = dates[valid].astype("datetime64[M]").astype("datetime64[D]")
+
+    # Серии: разрывы там, где между соседними непустыми днями больше одного дня
+    if valid_days.size:
+        breaks = np.flatnonzero(np.diff(valid_days) != 1) + 1
+        runs = np.diff(np.concatenate(([0], breaks, [valid_days.size])))
+        current = int(runs[-1]) if valid_days[-1] >= np.datetime64(streak_since, "D").astype("int64") else 0
+        streak = {"current": current, "longest": int(runs.max()), "last_date": _to_list(dates[valid][-1:])[0]}
+        total_change = float(valid_values[-1] - valid_values[0])
+    else:
+        streak = {"current": 0, "longest": 0, "last_date": None}
+        total_change = None
+
+    return {
+        "series": {
+            "date": _to_list(dates),
+            "value": _to_list(values),
+            "rolling_avg": _to_list(_rolling_mean(days, values, window)),
+            "delta": _to_list(delta),
+        },
+        "weekly": _buckets(week_start, valid_values),
+        "monthly": _buckets(month, valid_values),
+        "streak": streak,
+        "total_change": total_change,
+    }
+
+
+class IndicatorAnalyticsService:
+    """Аналитика ежедневных индикаторов пользователя по рядам за период, с кэшем результатов в Redis."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_user_analytics(self, user_id: UUID, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                 window: int = 7, indicator_id: Optional[UUID] = None) -> List[dict]:
+        """
+        Возвращает аналитику по каждому индикатору пользователя за период (границы включительно).
+        Текущая серия должна доходить до date_to, а без верхней границы - до сегодня или вчера
+        (сегодняшнее значение может быть ещё не записано).
+        """
+        streak_since = date_to if date_to is not None else date.today() - timedelta(days=1)
+        # Без верхней границы результат зависит от текущего дня - он входит в ключ кэша
+        params = f"{date_from}:{date_to}:{window}:{indicator_id}:{streak_since}"
+        # Версия читается до запроса к БД: запись, успевшая после неё, не даст закэшировать устаревший результат
+        version = await get_analytics_version(user_id)
+        if version is not None:
+            cached = await get_cached_analytics(user_id, version, params)
+            if cached is not None:
+                return cached
+
+        result = await self._compute(user_id, date_from, date_to, window, indicator_id, streak_since)
+        if version is not None:
+            await cache_analytics(user_id, version, params, result)
+        return result
+
+    async def _compute(self, user_id: UUID, date_from: Optional[date], date_to: Optional[date], window: int,
+                       indicator_id: Optional[UUID], streak_since: date) -> List[dict]:
+        D = DailyIndicatorModel
+        # Только нужные колонки одним запросом, без ORM-объектов; idx_user_date отбирает строки пользователя
+        query = select(D.indicator_id, D.date, D.value).where(D.user_id == user_id)
+        if date_from is not None:
+            query = query.where(D.date >= date_from)
+        if date_to is not None:
+            query = query.where(D.date <= date_to)
+        if indicator_id is not None:
+            query = query.where(D.indicator_id == indicator_id)
+        rows = (await self.db.execute(query.order_by(D.indicator_id, D.date))).all()
+        if not rows:
+            return []
+
+        indicator_ids, dates, values = zip(*rows)
+        dates = np.array(dates, dtype="datetime64[D]")
+        values = np.array(values, dtype=np.float64)  # None становится NaN
+        # Ряды идут подряд после сортировки по indicator_id - границы там, где id меняется
+        ids = np.array([str(i) for i in indicator_ids])
+        bounds = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1, [ids.size]))
+        return [
+            {"indicator_id": str(ids[start]),
+             **compute_series_analytics(dates[start:end], values[start:end], window, streak_since)}
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
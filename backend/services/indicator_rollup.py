@@ -0,0 +1,173 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, func, cast, case, distinct, true, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.indicators_models import IndicatorCollectionModel, DailyIndicatorModel, RollupWatermarkModel
+from utils.analytics_cache import invalidate_user_analytics
+
+ROLLUP_NAME = "daily_indicators"
+
+
+class RollupMetrics:
+    """Пропускная способность агрегации: сколько замеров и дневных строк обработано и за какое время."""
+
+    def __init__(self):
+        self.batches = 0
+        self.collections = 0
+        self.daily_rows = 0
+        self.total_time = 0.0
+        self.last_batch: Optional[dict] = None
+        self.watermark: Optional[datetime] = None
+        self.errors = 0
+
+    def record(self, batch: dict):
+        self.batches += 1
+        self.collections += batch["collections"]
+        self.daily_rows += batch["daily_rows"]
+        self.total_time += batch["duration_s"]
+        self.last_batch = batch
+        self.watermark = batch["watermark"]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "collections": self.collections,
+            "daily_rows": self.daily_rows,
+            "collections_per_s": round(self.collections / self.total_time, 1) if self.total_time else None,
+            "watermark": self.watermark,
+            "last_batch": self.last_batch,
+            "errors": self.errors,
+        }
+
+
+class DailyRollup:
+    """
+    Инкрементальная агрегация замеров indicator_collections в daily_indicators.
+
+    Каждый запуск берёт только замеры новее отметки в rollup_watermarks, считает по ним сумму, минимум,
+    максимум и количество для каждой тройки пользователь-индикатор-день и прибавляет их к дневным строкам
+    через INSERT ... ON CONFLICT. Слияние и сдвиг отметки выполняются в одной транзакции: после сбоя
+    ничего не учитывается дважды, и запуск можно просто повторить. Строка отметки блокируется на время
+    транзакции, поэтому задачи в нескольких воркерах не пересекаются.
+
+    Замеры моложе lag не берутся: collection_time - время начала транзакции, которая его вставила,
+    и ещё не зафиксированная транзакция могла бы оказаться позади сдвинутой отметки.
+    """
+
+    def __init__(self, lag: float, window_hours: float):
+        self.lag = timedelta(seconds=lag)
+        self.window = timedelta(hours=window_hours)
+        self.metrics = RollupMetrics()
+
+    async def _lock_watermark(self, db: AsyncSession) -> RollupWatermarkModel:
+        await db.execute(
+            pg_insert(RollupWatermarkModel).values(name=ROLLUP_NAME, watermark=None).on_conflict_do_nothing()
+        )
+        return await db.scalar(
+            select(RollupWatermarkModel).where(RollupWatermarkModel.name == ROLLUP_NAME)
+            .with_for_update().execution_options(populate_existing=True)
+        )
+
+    async def run_batch(self, db: AsyncSession) -> Optional[dict]:
+        """
+        Обрабатывает одно окно замеров после отметки и фиксирует транзакцию.
+        Возвращает сводку по окну или None, если новых замеров, доступных для агрегации, нет.
+        """
+        started = time.perf_counter()
+        C = IndicatorCollectionModel
+        D = DailyIndicatorModel
+        async with db.begin():
+            mark = await self._lock_watermark(db)
+            safe_until = await db.scalar(select(func.localtimestamp())) - self.lag
+            # Окно начинается с первого необработанного замера - пустые промежутки истории не перебираются
+            newer = C.collection_time > mark.watermark if mark.watermark is not None else true()
+            first = await db.scalar(select(func.min(C.collection_time)).where(newer))
+            if first is None or first > safe_until:
+                return None
+            upper = min(first + self.window, safe_until)
+
+            day = cast(C.collection_time, Date)
+            delta = (
+                select(
+                    func.gen_random_uuid(), C.user_id, day, C.indicator_id,
+                    func.sum(C.value), func.min(C.value), func.max(C.value), func.count(C.value),
+                    func.avg(C.value), func.now(), func.now(),
+                )
+                .where(newer, C.collection_time <= upper, C.value.isnot(None))
+                .group_by(C.user_id, day, C.indicator_id)
+            )
+            stmt = pg_insert(D).from_select(
+                ["id", "user_id", "date", "indicator_id", "value_sum", "value_min", "value_max", "value_count",
+                 "value", "created_at", "updated_at"],
+                delta,
+            )
+            value_sum = func.coalesce(D.value_sum, 0) + stmt.excluded.value_sum
+            value_count = func.coalesce(D.value_count, 0) + stmt.excluded.value_count
+            # value заменяется средним по замерам, кроме заданного вручную: агрегаты копятся и для него
+            stmt = stmt.on_conflict_do_update(
+                constraint='uix_user_date_indicator',
+                set_={
+                    "value_sum": value_sum,
+                    "value_count": value_count,
+                    "value_min": func.least(D.value_min, stmt.excluded.value_min),
+                    "value_max": func.greatest(D.value_max, stmt.excluded.value_max),
+                    "value": case((D.is_manual, D.value), else_=value_sum / value_count),
+                    "updated_at": func.now(),
+                },
+            ).returning(D.user_id)
+            # Сколько замеров учтено и чьи дни изменились - одним запросом с вставкой
+            upserted = stmt.cte("upserted")
+            collections = (
+                select(func.count()).where(newer, C.collection_time <= upper).scalar_subquery()
+            )
+            daily_rows, user_ids, collections = (await db.execute(
+                select(func.count(), func.array_agg(distinct(upserted.c.user_id)), collections).select_from(upserted)
+            )).one()
+
+            mark.watermark = upper
+        await invalidate_user_analytics(user_ids or [])
+        batch = {
+            "window_start": first,
+            "watermark": upper,
+            "collections": collections,
+            "daily_rows": daily_rows,
+            "duration_s": round(time.perf_counter() - started, 4),
+        }
+        self.metrics.record(batch)
+        return batch
+
+    async def run(self, session_maker) -> list[dict]:
+        """Обрабатывает окна одно за другим, пока не догонит текущее время за вычетом lag."""
+        batches = []
+        while True:
+            async with session_maker() as db:
+                batch = await self.run_batch(db)
+            if batch is None:
+                return batches
+            print(f"Агрегация индикаторов: {batch['collections']} замеров -> {batch['daily_rows']} дневных строк "
+                  f"до {batch['watermark']} за {batch['duration_s']} с")
+            batches.append(batch)
+
+    async def run_forever(self, session_maker, interval: float):
+        """Фоновая задача: раз в interval секунд догоняет новые замеры."""
+        while True:
+            try:
+                await self.run(session_maker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.errors += 1
+                print("Ошибка агрегации ежедневных индикаторов:", e)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return self.metrics.stats()
+
+
+daily_rollup = DailyRollup(settings.ROLLUP_LAG, settings.ROLLUP_WINDOW_HOURS)
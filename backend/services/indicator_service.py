@@ -1,74 +1,130 @@
+from datetime import date
 from typing import List, Optional
 from uuid import UUID
-from sqlalchemy.orm import Session
+
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.indicators_models import IndicatorModel, IndicatorCollectionModel, DailyIndicatorModel
 from schemas.indicators_schema import IndicatorCreate, IndicatorSchema, IndicatorCollectionSchema, \
     IndicatorCollectionCreate, DailyIndicatorCreate, DailyIndicatorSchema
+from utils.analytics_cache import invalidate_user_analytics
+
+# Строк в одном INSERT ежедневных индикаторов: 6 параметров на строку укладываются в лимит asyncpg (32767)
+DAILY_UPSERT_PAGE_SIZE = 5000
 
 
 class IndicatorService:
     """Содержит методы для создания индикаторов, получения индикатора по ID и получения всех индикаторов."""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_indicator(self, indicator_data: IndicatorCreate) -> IndicatorSchema:
+    async def create_indicator(self, indicator_data: IndicatorCreate) -> IndicatorSchema:
         """Создаёт новый индикатор и сохраняет его в базе данных."""
-        indicator = IndicatorModel(**indicator_data.dict())
-        self.db.add(indicator)
-        self.db.commit()
-        self.db.refresh(indicator)
-        return IndicatorSchema.from_orm(indicator)
-
-    def get_indicator(self, indicator_id: UUID) -> Optional[IndicatorSchema]:
+        return (await self.create_indicators([indicator_data]))[0]
+
+    async def create_indicators(self, indicators_data: List[IndicatorCreate]) -> List[IndicatorSchema]:
+        """Создаёт пачку индикаторов одним INSERT ... RETURNING и одним коммитом."""
+        if not indicators_data:
+            return []
+        result = await self.db.scalars(
+            insert(IndicatorModel).returning(IndicatorModel),
+            [indicator.model_dump() for indicator in indicators_data],
+        )
+        indicators = [IndicatorSchema.model_validate(ind) for ind in result.all()]
+        await self.db.commit()
+        return indicators
+
+    async def get_indicator(self, indicator_id: UUID) -> Optional[IndicatorSchema]:
         """Получает индикатор по его ID."""
-        indicator = self.db.query(IndicatorModel).filter(IndicatorModel.id == indicator_id).first()
+        indicator = await self.db.get(IndicatorModel, indicator_id)
         if indicator:
-            return IndicatorSchema.from_orm(indicator)
+            return IndicatorSchema.model_validate(indicator)
         return None  # Можно обработать этот случай в маршрутах
 
-    def get_all_indicators(self) -> List[IndicatorSchema]:
+    async def get_all_indicators(self) -> List[IndicatorSchema]:
         """Получает все индикаторы из базы данных."""
-        indicators = self.db.query(IndicatorModel).all()
-        return [IndicatorSchema.from_orm(ind) for ind in indicators]
+        indicators = await self.db.scalars(select(IndicatorModel))
+        return [IndicatorSchema.model_validate(ind) for ind in indicators.all()]
 
 
 class IndicatorCollectionService:
     """Содержит методы для создания коллекций индикаторов и получения коллекций индикаторов по ID пользователя."""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_indicator_collection(self, collection_data: IndicatorCollectionCreate) -> IndicatorCollectionSchema:
+    async def create_indicator_collection(self, collection_data: IndicatorCollectionCreate) -> IndicatorCollectionSchema:
         """Создаёт новую коллекцию индикаторов и сохраняет её в базе данных."""
-        collection = IndicatorCollectionModel(**collection_data.dict())
-        self.db.add(collection)
-        self.db.commit()
-        self.db.refresh(collection)
-        return IndicatorCollectionSchema.from_orm(collection)
-
-    def get_collections_by_user(self, user_id: UUID) -> List[IndicatorCollectionSchema]:
+        return (await self.create_indicator_collections([collection_data]))[0]
+
+    async def create_indicator_collections(
+            self, collections_data: List[IndicatorCollectionCreate]) -> List[IndicatorCollectionSchema]:
+        """Сохраняет пачку замеров одним INSERT ... RETURNING и одним коммитом."""
+        if not collections_data:
+            return []
+        result = await self.db.scalars(
+            insert(IndicatorCollectionModel).returning(IndicatorCollectionModel),
+            [collection.model_dump() for collection in collections_data],
+        )
+        collections = [IndicatorCollectionSchema.model_validate(coll) for coll in result.all()]
+        await self.db.commit()
+        return collections
+
+    async def get_collections_by_user(self, user_id: UUID) -> List[IndicatorCollectionSchema]:
         """Получает все коллекции индикаторов пользователя по его ID."""
-        collections = self.db.query(IndicatorCollectionModel).filter(IndicatorCollectionModel.user_id == user_id).all()
-        return [IndicatorCollectionSchema.from_orm(coll) for coll in collections]
+        collections = await self.db.scalars(
+            select(IndicatorCollectionModel).where(IndicatorCollectionModel.user_id == user_id)
+        )
+        return [IndicatorCollectionSchema.model_validate(coll) for coll in collections.all()]
 
 
 class DailyIndicatorService:
-    """Содержит методы для создания ежедневных индикаторов и получения ежедневных индикаторов по ID пользователя."""
+    """Содержит методы для записи ежедневных индикаторов и получения ежедневных индикаторов по ID пользователя."""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create_daily_indicator(self, indicator_data: DailyIndicatorCreate) -> DailyIndicatorSchema:
-        """Создаёт новый ежедневный индикатор и сохраняет его в базе данных."""
-        daily_indicator = DailyIndicatorModel(**indicator_data.dict())
-        self.db.add(daily_indicator)
-        self.db.commit()
-        self.db.refresh(daily_indicator)
-        return DailyIndicatorSchema.from_orm(daily_indicator)
-
-    def get_daily_indicators_by_user(self, user_id: UUID) -> List[DailyIndicatorSchema]:
-        """Получает все ежедневные индикаторы пользователя по его ID."""
-        daily_indicators = self.db.query(DailyIndicatorModel).filter(DailyIndicatorModel.user_id == user_id).all()
-        return [DailyIndicatorSchema.from_orm(di) for di in daily_indicators]
\ No newline at end of file
+    async def upsert_daily_indicator(self, indicator_data: DailyIndicatorCreate) -> DailyIndicatorSchema:
+        """Создаёт ежедневный индикатор или обновляет значение за этот день, если оно уже записано."""
+        return (await self.upsert_daily_indicators([indicator_data]))[0]
+
+    async def upsert_daily_indicators(self, indicators_data: List[DailyIndicatorCreate]) -> List[DailyIndicatorSchema]:
+        """
+        Записывает пачку ежедневных индикаторов (например, день для многих пользователей) одним
+        INSERT ... ON CONFLICT по uix_user_date_indicator: существующие значения за день перезаписываются.
+        Повторы одной тройки user_id-date-indicator_id внутри пачки схлопываются, побеждает последний.
+        Строки отмечаются как заданные вручную - агрегация замеров не заменяет их value своим средним.
+        """
+        rows = {
+            (indicator.user_id, indicator.date, indicator.indicator_id): {**indicator.model_dump(), "is_manual": True}
+            for indicator in indicators_data
+        }
+        if not rows:
+            return []
+        stmt = pg_insert(DailyIndicatorModel)
+        stmt = stmt.on_conflict_do_update(
+            constraint='uix_user_date_indicator',
+            set_={"value": stmt.excluded.value, "is_manual": True, "updated_at": func.now()},
+        ).returning(DailyIndicatorModel)
+        # Страница insertmanyvalues по умолчанию - 1000 строк; выше неё пачку режет только лимит параметров драйвера
+        result = await self.db.scalars(stmt, list(rows.values()), execution_options={
+            "populate_existing": True, "insertmanyvalues_page_size": DAILY_UPSERT_PAGE_SIZE,
+        })
+        indicators = [DailyIndicatorSchema.model_validate(di) for di in result.all()]
+        await self.db.commit()
+        await invalidate_user_analytics(indicator.user_id for indicator in indicators)
+        return indicators
+
+    async def get_daily_indicators_by_user(self, user_id: UUID, date_from: Optional[date] = None,
+                                           date_to: Optional[date] = None) -> List[DailyIndicatorSchema]:
+        """Получает ежедневные индикаторы пользователя по его ID, при необходимости - за диапазон дат."""
+        query = select(DailyIndicatorModel).where(DailyIndicatorModel.user_id == user_id)
+        if date_from is not None:
+            query = query.where(DailyIndicatorModel.date >= date_from)
+        if date_to is not None:
+            query = query.where(DailyIndicatorModel.date <= date_to)
+        daily_indicators = await self.db.scalars(query.order_by(DailyIndicatorModel.date))
+        return [DailyIndicatorSchema.model_validate(di) for di in daily_indicators.all()]
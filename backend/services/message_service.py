@@ -1,19 +1,25 @@
 # backend/services/message_service.py
 import json
 from datetime import datetime
-from typing import Dict
+from typing import Awaitable, Callable, Dict, List
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from repositories.message_repository import create_message
-from services.entity_service import extract_entities
+from repositories.message_repository import insert_message, create_messages
+from services.nlp_executor import nlp_executor
 from schemas.message_schema import MessageCreate
-from repositories.entity_repository import save_entity, find_or_create_entity_requirement, \
-    check_missing_data_and_ask_questions
+from repositories.entity_repository import save_entities, find_or_create_entity_requirement, \
+    missing_data_questions
+from repositories.topic_repository import resolve_topic, prefetch_topic_answers
+from utils.reference_cache import RequirementSnapshot
 from services.topic_service import handle_topic
 from services.user_service import UserService
+from utils.db_metrics import count_statements, message_statement_stats
 from utils.redis_client import redis_client
 
+# Вызывается сразу после фиксации транзакции с сообщениями, которые больше не нужно обрабатывать
+OnSaved = Callable[[List[dict]], Awaitable[None]]
+
 
 async def accumulate_questions(tg_user_id: int, new_questions: Dict[str, str]):
     """
@@ -42,51 +48,207 @@ async def accumulate_questions(tg_user_id: int, new_questions: Dict[str, str]):
 
 
 
+def parse_message(message_data: dict) -> tuple[str, datetime]:
+    """
+    Проверяет сообщение из очереди до транзакции: текст и время отправки.
+    Выбрасывает ValueError для сообщения, которое нельзя сохранить.
+    """
+    text = message_data.get("text")
+    if not isinstance(text, str):
+        raise ValueError(f"Сообщение без текста: {message_data!r}")
+    try:
+        timestamp = datetime.fromtimestamp(message_data["timestamp"])
+    except (KeyError, TypeError, ValueError, OverflowError, OSError) as e:
+        raise ValueError(f"Некорректное время сообщения {message_data.get('timestamp')!r}") from e
+    return text, timestamp
+
+
 class MessageService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def process_message(self, message_data: dict, tg_user_id: int):
-        print('Создание транзакции')
+    async def process_message(self, message_data: dict, tg_user_id: int,
+                              entity_data: dict | None = None, prefetched: dict | None = None,
+                              on_saved: OnSaved | None = None):
+        """
+        Обрабатывает одно сообщение минимальным числом обращений к БД.
+
+        Сущности и ответ GPT о новой теме получаются до начала транзакции, требования и тема определяются до записи,
+        поэтому сообщение (вместе с токенами GPT) и сущность (вместе с theme_id) сохраняются
+        одним INSERT каждое, а недостающие поля считаются по извлечённым данным в памяти.
+        Уже извлечённые сущности и ответы GPT передаёт process_messages_batch, когда обрабатывает порцию по одному.
+        on_saved вызывается после фиксации, до вопросов в Redis: их ошибка не приводит к повторной записи сообщения.
+        """
+        text, timestamp = parse_message(message_data)
+        # 1. Извлекаем сущности - до транзакции, чтобы не держать соединение на время NLP
+        if entity_data is None:
+            entity_data = await nlp_executor.extract(text)
+        print('СУЩНОСТИ', entity_data)
         try:
-            async with self.db.begin():  # Используем одну транзакцию для всех операций
-                # 1. Получаем пользователя
-                user_service = UserService(self.db)
-                print('User service - ', user_service)
-                user = await user_service.get_user_by_tg_id(tg_user_id)
-                if not user:
-                    raise ValueError(f"User with ID {tg_user_id} not found.")
-                # 2. Сохраняем сообщение
-                message_create = MessageCreate(
-                    user_id=user.id,
-                    text=message_data.get("text"),
-                    timestamp=datetime.fromtimestamp(message_data.get("timestamp"))
-                )
-                print("Подготовленое к сохранению сообщение", message_create)
-                try:
-                    saved_message = await create_message(self.db, message_create)
-                    print("Сохраненное сообщение", saved_message)
-                except Exception as e:
-                    print("Ошибка при сохранении сообщения:", e)
-                # 3. Извлекаем сущности
-                entity_data = extract_entities(saved_message.text)
-                print('СУЩНОСТИ', entity_data)
-                # 4. Проверка или создание требования для action и object
-                requirement = await find_or_create_entity_requirement(
-                    action=entity_data.get('action'),
-                    object_=entity_data.get('object'),
-                    db=self.db)
-                # 5. Сохранение сущности с привязкой к `entity_requirements_id`
-                await save_entity(self.db, saved_message.id, entity_data, entity_requirements_id=requirement.id)
-                # 6. Обработка темы
-                await handle_topic(entity_data, saved_message.id, self.db)
-                # 7. Проверка недостающих данных и накопление вопросов
-                questions = await check_missing_data_and_ask_questions(saved_message.id, self.db)
-                if questions:
-                    # Накапливаем вопросы в Redis для последующей отправки
-                    await accumulate_questions(tg_user_id, questions)
+            # 2. Тему, которой ещё нет, заранее спрашиваем у GPT - ожидание ответа не держит транзакцию
+            if prefetched is None:
+                prefetched = await prefetch_topic_answers(
+                    [(entity_data.get('action'), entity_data.get('object'))], self.db)
+            print('Создание транзакции')
+            with count_statements() as statements:
+                async with self.db.begin():  # Используем одну транзакцию для всех операций
+                    # 3. Получаем пользователя
+                    user = await UserService(self.db).get_user_by_tg_id(tg_user_id)
+                    if not user:
+                        raise ValueError(f"User with ID {tg_user_id} not found.")
+                    # 4. Требования для action и object - из снимка справочных данных, при промахе из БД
+                    requirement = await find_or_create_entity_requirement(
+                        action=entity_data.get('action'),
+                        object_=entity_data.get('object'),
+                        db=self.db)
+                    # 5. Тема - до сохранения сообщения, чтобы записать токены GPT тем же INSERT
+                    topic, token_usage = await resolve_topic(entity_data.get('action'), entity_data.get('object'),
+                                                             self.db, prefetched)
+                    # 6. Сохраняем сообщение: INSERT ... RETURNING id
+                    message_id = await insert_message(self.db, MessageCreate(
+                        user_id=user.id,
+                        text=text,
+                        timestamp=timestamp,
+                        is_processed=topic is None,
+                        token_usage=token_usage or None,
+                    ))
+                    print("Сохраненное сообщение", message_id)
+                    # 7. Сохраняем сущность сразу с темой и требованием
+                    await save_entities(self.db, [
+                        (message_id, {**entity_data, "theme_id": topic.id if topic else 0}, requirement.id)
+                    ])
+            if on_saved is not None:
+                await on_saved([message_data])
+            message_statement_stats.record(statements[0])
+            print(f"SQL-запросов на сообщение {message_id}: {statements[0]}")
+            # 8. Недостающие данные - по извлечённым сущностям, вопросы накапливаем после фиксации
+            questions = missing_data_questions(entity_data, requirement)
+            if questions:
+                # Накапливаем вопросы в Redis для последующей отправки
+                await accumulate_questions(tg_user_id, questions)
         except Exception as e:
             print("Ошибка во время обработки сообщения:", e)
             import traceback
             traceback.print_exc()
-            raise  # Повторно выбрасываем исключение для обработки на уровне выше
\ No newline at end of file
+            raise  # Повторно выбрасываем исключение для обработки на уровне выше
+
+    async def process_messages_batch(self, messages_data: List[dict], tg_user_id: int, on_saved: OnSaved | None = None):
+        """
+        Обрабатывает всю порцию сообщений пользователя в одной сессии и одной транзакции.
+
+        Пользователь ищется один раз, сообщения и сущности сохраняются одним INSERT каждые,
+        требования создаются один раз на пару action/object. Темы и вопросы обрабатываются
+        по порядку сообщений, каждое в своей точке сохранения: ошибка в одном сообщении
+        не откатывает остальные. Порция уже забрана из очереди, поэтому некорректные сообщения
+        отбрасываются до транзакции, а если общая запись не удалась, сообщения сохраняются по одному.
+        on_saved получает отброшенные сообщения сразу, сохранённые - после фиксации их транзакции.
+        """
+        valid, dropped = [], []
+        for index, message_data in enumerate(messages_data):
+            try:
+                valid.append((message_data, *parse_message(message_data)))
+            except ValueError as e:
+                print(f"Сообщение {index} порции пользователя {tg_user_id} отброшено:", e)
+                dropped.append(message_data)
+        if dropped and on_saved is not None:
+            await on_saved(dropped)
+        if not valid:
+            return
+        texts = [text for _, text, _ in valid]
+        # 1. Извлекаем сущности всей порции одним проходом nlp.pipe - до транзакции, как и в process_message
+        try:
+            entities: List[dict | None] = await nlp_executor.extract_batch(texts)
+        except Exception as e:
+            print("Ошибка пакетного извлечения сущностей, обрабатываем сообщения по одному:", e)
+            entities = []
+            for index, text in enumerate(texts):
+                try:
+                    entities.append(await nlp_executor.extract(text))
+                except Exception as e:
+                    print(f"Ошибка при извлечении сущностей из сообщения {index} порции:", e)
+                    entities.append(None)
+        # 2. Новые темы всей порции спрашиваем у GPT заранее и одновременно - они уходят одной пачкой
+        pairs = [(e.get('action'), e.get('object')) for e in entities if e is not None]
+        prefetched = await prefetch_topic_answers(pairs, self.db)
+        try:
+            with count_statements() as statements:
+                collected_questions = await self._save_batch(valid, entities, prefetched, tg_user_id)
+        except Exception as e:
+            # Транзакция откачена целиком: сохраняем сообщения по одному, чтобы ошибка одного не теряла остальные
+            print(f"Ошибка при сохранении порции пользователя {tg_user_id}, сохраняем сообщения по одному:", e)
+            await self._process_one_by_one(valid, entities, prefetched, tg_user_id, on_saved)
+            return
+        if on_saved is not None:
+            await on_saved([message_data for message_data, _, _ in valid])
+        message_statement_stats.record(statements[0], len(valid))
+        # 8. Накапливаем вопросы в Redis одним обращением после фиксации транзакции
+        if collected_questions:
+            await accumulate_questions(tg_user_id, collected_questions)
+
+    async def _save_batch(self, valid: List[tuple[dict, str, datetime]], entities: List[dict | None],
+                          prefetched: dict, tg_user_id: int) -> Dict[str, str]:
+        """Записывает проверенную порцию в одной транзакции и возвращает вопросы о недостающих данных."""
+        collected_questions: Dict[str, str] = {}
+        async with self.db.begin():
+            # 3. Получаем пользователя
+            user = await UserService(self.db).get_user_by_tg_id(tg_user_id)
+            if not user:
+                raise ValueError(f"User with ID {tg_user_id} not found.")
+            # 4. Сохраняем все сообщения, сохраняя порядок
+            messages_create = [
+                MessageCreate(user_id=user.id, text=text, timestamp=timestamp) for _, text, timestamp in valid
+            ]
+            message_ids = await create_messages(self.db, messages_create)
+            extracted = [
+                (message_id, entity_data) for message_id, entity_data in zip(message_ids, entities)
+                if entity_data is not None
+            ]
+            # 5. Требования - по одному запросу на уникальную пару action и object. Пары идут в одном порядке
+            # во всех воркерах: вставка с ON CONFLICT блокирует существующую строку до конца транзакции.
+            # Каждая пара в своей точке сохранения: ошибка запроса не прерывает транзакцию порции
+            requirements: Dict[tuple, RequirementSnapshot | None] = {}
+            keys = {(entity_data.get('action'), entity_data.get('object')) for _, entity_data in extracted}
+            for key in sorted(keys, key=lambda pair: (pair[0] or '', pair[1] or '')):
+                try:
+                    async with self.db.begin_nested():
+                        requirements[key] = await find_or_create_entity_requirement(
+                            action=key[0], object_=key[1], db=self.db)
+                except Exception as e:
+                    print(f"Ошибка при поиске требования для {key}:", e)
+                    requirements[key] = None
+            # 6. Сохраняем все сущности
+            entity_requirements = [requirements[(e.get('action'), e.get('object'))] for _, e in extracted]
+            await save_entities(self.db, [
+                (message_id, entity_data, requirement.id if requirement else None)
+                for (message_id, entity_data), requirement in zip(extracted, entity_requirements)
+            ])
+            # 7. Темы - по порядку, каждое сообщение в своей точке сохранения; недостающие данные - в памяти
+            for (message_id, entity_data), requirement in zip(extracted, entity_requirements):
+                try:
+                    async with self.db.begin_nested():
+                        await handle_topic(entity_data, message_id, self.db, prefetched)
+                except Exception as e:
+                    print(f"Ошибка во время обработки сообщения {message_id}:", e)
+                    continue
+                questions = missing_data_questions(entity_data, requirement) if requirement else None
+                if questions:
+                    collected_questions.update(questions)
+        return collected_questions
+
+    async def _process_one_by_one(self, valid: List[tuple[dict, str, datetime]], entities: List[dict | None],
+                                  prefetched: dict, tg_user_id: int, on_saved: OnSaved | None):
+        """
+        Запасной путь после неудачной записи порции: каждое сообщение в своей транзакции через process_message.
+        Если не сохранилось ни одно, ошибка выбрасывается дальше - записи стрима не подтверждаются
+        (например, пользователь не найден).
+        """
+        error = None
+        saved = 0
+        for (message_data, _, _), entity_data in zip(valid, entities):
+            try:
+                await self.process_message(message_data, tg_user_id, entity_data, prefetched, on_saved)
+                saved += 1
+            except Exception as e:
+                error = e
+        if not saved and error is not None:
+            raise error
@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+from core.config import settings
+from services import entity_service
+from services.entity_cache import entity_cache, normalize_text
+
+
+# Модули, которые fork-сервер импортирует один раз: nlp_preload загружает модель
+_FORKSERVER_PRELOAD = ["services.nlp_preload"]
+
+
+def _init_worker():
+    """
+    Инициализация дочернего процесса: модель уже загружена fork-сервером при импорте nlp_preload,
+    здесь она прогревается, чтобы первая задача процесса не была медленной.
+    """
+    entity_service.warm_up_nlp()
+
+
+def _extract_batch(texts: List[str]) -> List[dict]:
+    # Внутри дочернего процесса spaCy работает в одном процессе
+    return entity_service.extract_entities_batch(texts, n_process=1)
+
+
+class NlpExecutor:
+    """
+    Пул процессов для извлечения сущностей, чтобы разбор spaCy не блокировал цикл событий.
+
+    Процессы создаются через forkserver: fork из работающего многопоточного приложения небезопасен.
+    Fork-сервер - отдельный однопоточный процесс - один раз загружает модель, а процессы пула, порождённые
+    из него через fork, используют её память совместно (copy-on-write). Текущий процесс модель не загружает.
+    Количество одновременно ожидающих задач ограничено max_pending, остальные вызовы ждут.
+    При workers=0 разбор выполняется в текущем процессе, как раньше.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+        # Компоненты модели и время прогрева, о которых сообщил процесс пула
+        self._worker_pipeline: dict = {"pipeline": None, "pipeline_timings_ms": {}}
+
+    def start(self):
+        """Создаёт пул процессов. Вызывается при старте приложения."""
+        if self.workers > 0 and self._pool is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(_FORKSERVER_PRELOAD)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+            )
+            # Процессы пула создаются по мере поступления задач - запускаем их сразу при старте задачами,
+            # которые заодно возвращают сведения о модели для stats
+            for _ in range(self.workers):
+                self._pool.submit(entity_service.pipeline_info).add_done_callback(self._remember_pipeline)
+
+    def _remember_pipeline(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._worker_pipeline = future.result()
+
+    def shutdown(self):
+        """Останавливает пул процессов."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def extract(self, text: str) -> dict:
+        """Асинхронно извлекает сущности из одного текста."""
+        return (await self.extract_batch([text]))[0]
+
+    async def extract_batch(self, texts: List[str]) -> List[dict]:
+        """Асинхронно извлекает сущности из пачки текстов: сначала из кэша, остальные - в дочернем процессе."""
+        texts = list(texts)
+        if settings.ENTITY_CACHE_SIZE <= 0:
+            return await self._extract_uncached(texts)
+        results = await entity_cache.get_many(texts)
+        # Одинаковые после нормализации тексты разбираем один раз
+        missing: dict[str, list[int]] = {}
+        for index, text in enumerate(texts):
+            if index not in results:
+                missing.setdefault(normalize_text(text), []).append(index)
+        if missing:
+            first_indexes = [indexes[0] for indexes in missing.values()]
+            extracted = await self._extract_uncached([texts[index] for index in first_indexes])
+            for indexes, entities in zip(missing.values(), extracted):
+                for index in indexes:
+                    results[index] = dict(entities)
+            await entity_cache.set_many({texts[index]: results[index] for index in first_indexes})
+        return [results[index] for index in range(len(texts))]
+
+    async def _extract_uncached(self, texts: List[str]) -> List[dict]:
+        if self.workers <= 0:
+            return entity_service.extract_entities_batch(texts)
+        self.start()
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, _extract_batch, texts)
+            except BrokenProcessPool:
+                # Дочерний процесс упал - пересоздаём пул для следующих вызовов
+                self.shutdown()
+                raise
+            finally:
+                self.pending -= 1
+
+    def stats(self) -> dict:
+        """Текущая загрузка пула."""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            **(self._worker_pipeline if self.workers > 0 else entity_service.pipeline_info()),
+            "cache": entity_cache.stats(),
+        }
+
+
+nlp_executor = NlpExecutor(settings.NLP_WORKERS, settings.NLP_MAX_PENDING)
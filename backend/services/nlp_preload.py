@@ -0,0 +1,7 @@
+"""
+Импортируется только fork-сервером пула NlpExecutor: модель загружается до порождения процессов пула,
+и они используют её память совместно (copy-on-write). Процесс API этот модуль не импортирует.
+"""
+from services.entity_service import get_nlp
+
+get_nlp()
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class UserQueueDispatcher:
+    """
+    Запускает обработку очередей разных пользователей параллельно, но не больше max_concurrency
+    одновременно. Задачи одного пользователя выполняются строго по очереди в порядке добавления.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._user_tails: dict[int, asyncio.Task] = {}  # Последняя поставленная задача каждого пользователя
+        self.in_flight = 0  # Выполняются прямо сейчас
+        self.waiting = 0  # Ждут свободного слота или завершения предыдущей задачи пользователя
+
+    def submit(self, tg_user_id: int, handler: Callable[..., Awaitable], *args) -> asyncio.Task:
+        """Ставит handler(tg_user_id, *args) в очередь пользователя и возвращает задачу."""
+        previous = self._user_tails.get(tg_user_id)
+        task = asyncio.create_task(self._run(tg_user_id, previous, handler, args))
+        self._user_tails[tg_user_id] = task
+        task.add_done_callback(lambda finished: self._forget(tg_user_id, finished))
+        return task
+
+    def _forget(self, tg_user_id: int, task: asyncio.Task):
+        # Удаляем пользователя, только если после этой задачи ему ничего не поставили
+        if self._user_tails.get(tg_user_id) is task:
+            del self._user_tails[tg_user_id]
+
+    async def _run(self, tg_user_id: int, previous: asyncio.Task | None, handler, args):
+        self.waiting += 1
+        started = False
+        try:
+            if previous is not None:
+                # Ошибка предыдущей задачи не должна блокировать следующие
+                await asyncio.wait([previous])
+            async with self._semaphore:
+                self.waiting -= 1
+                started = True
+                self.in_flight += 1
+                try:
+                    await handler(tg_user_id, *args)
+                finally:
+                    self.in_flight -= 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ошибка при обработке очереди пользователя {tg_user_id}:", e)
+        finally:
+            if not started:
+                self.waiting -= 1
+
+    def stats(self) -> dict:
+        """Текущая загрузка диспетчера."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "users": len(self._user_tails),
+        }
@@ -3,30 +3,62 @@ import json
 
 from fastapi import Depends
 
+from core.config import settings
 from db.session import get_async_session
-from utils.queue_manager import fetch_and_clear_user_queue
+from utils.queue_manager import fetch_and_clear_user_queue, pop_due_users
 from utils.redis_client import redis_client
-from services.message_service import MessageService
+from utils.stream_queue import ensure_consumer_group, read_stream_batch, reclaim_pending_entries, ack_entries, \
+    consumer_name
+from services.message_service import MessageService, OnSaved
+from services.queue_dispatcher import UserQueueDispatcher
 from sqlalchemy.ext.asyncio import AsyncSession
 
+# Общий диспетчер: разные пользователи параллельно, сообщения одного пользователя - по порядку
+queue_dispatcher = UserQueueDispatcher(settings.QUEUE_WORKER_CONCURRENCY)
 
-async def process_user_queue(tg_user_id: int):
-    """Обрабатывает очередь сообщений пользователя с ограничением параллельных задач."""
-    messages = await fetch_and_clear_user_queue(tg_user_id)
-    print('Fetched messages:', messages)
+
+async def process_user_messages(tg_user_id: int, messages: list[dict], on_saved: OnSaved | None = None):
+    """
+    Обрабатывает уже извлечённую порцию сообщений пользователя.
+    on_saved вызывается сразу после фиксации каждой транзакции с сообщениями, записанными в ней.
+    """
+    if settings.QUEUE_BATCH_PROCESSING:
+        # Одна сессия и одна транзакция на всю порцию
+        async for db in get_async_session():
+            await MessageService(db).process_messages_batch(messages, tg_user_id, on_saved)
+        return
 
     # Оборачиваем процесс обработки сообщения в задачу с использованием семафора
     async def process_single_message(message_data):
         # Создаем новую сессию для каждого сообщения
         async for db in get_async_session():
             message_service = MessageService(db)
-            await message_service.process_message(message_data, tg_user_id)
+            await message_service.process_message(message_data, tg_user_id, on_saved=on_saved)
 
     # Запускаем параллельные задачи для каждого сообщения
     tasks = [process_single_message(message) for message in messages]
     await asyncio.gather(*tasks)
 
-    # Печать вопросов
+
+async def process_user_queue(tg_user_id: int):
+    """Обрабатывает очередь сообщений пользователя порциями не больше QUEUE_MAX_BATCH."""
+    while True:
+        messages = await fetch_and_clear_user_queue(tg_user_id, max_batch=settings.QUEUE_MAX_BATCH)
+        print('Fetched messages:', messages)
+        if not messages:
+            break
+
+        await process_user_messages(tg_user_id, messages)
+
+        # Неполная порция означает, что очередь опустела
+        if len(messages) < settings.QUEUE_MAX_BATCH:
+            break
+
+    await print_user_questions(tg_user_id)
+
+
+async def print_user_questions(tg_user_id: int):
+    """Выводит накопленные в Redis вопросы пользователя."""
     redis = await redis_client.get_redis()
     key = f"questions:{tg_user_id}"
     # Логируем, чтобы проверить, существует ли ключ в Redis
@@ -60,4 +92,80 @@ async def check_expired_queues():
             key = message["data"].decode()
             if key.startswith("user_timer:"):
                 tg_user_id = int(key.split(":")[-1])
-                await process_user_queue(tg_user_id)
+                # Не ждём завершения: медленный пользователь не задерживает остальных
+                queue_dispatcher.submit(tg_user_id, process_user_queue)
+
+
+async def poll_due_queues():
+    """
+    Фоновая задача для QUEUE_SCHEDULER="zset": раз в QUEUE_SCHEDULER_TICK_MS забирает всех пользователей,
+    у которых истёк таймер тишины, и отправляет их очереди на обработку.
+
+    Расписание хранится в Redis, поэтому таймеры не теряются, если в момент срабатывания никто не слушал.
+    """
+    while True:
+        try:
+            for tg_user_id in await pop_due_users():
+                queue_dispatcher.submit(tg_user_id, process_user_queue)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Ошибка при опросе расписания очередей:", e)
+        await asyncio.sleep(settings.QUEUE_SCHEDULER_TICK_MS / 1000)
+
+
+async def process_stream_entries(entries: list[tuple[str, int | None, dict | None]]):
+    """Группирует записи стрима по пользователям, обрабатывает их по порядку и подтверждает успешные."""
+    by_user: dict[int, list[tuple[str, dict]]] = {}
+    orphaned = []
+    for entry_id, tg_user_id, message in entries:
+        if message is None:
+            # Запись уже вытеснена из стрима - подтверждаем, чтобы не забирать её снова
+            orphaned.append(entry_id)
+            continue
+        by_user.setdefault(tg_user_id, []).append((entry_id, message))
+    await ack_entries(orphaned)
+
+    async def process_and_ack(tg_user_id: int, user_entries: list[tuple[str, dict]]):
+        # Записи подтверждаются сразу после фиксации сообщений в БД, до вопросов в Redis: повторная доставка
+        # возможна только для незафиксированных сообщений, иначе они сохранились бы дважды
+        entry_ids = {id(message): entry_id for entry_id, message in user_entries}
+
+        async def ack_saved(messages: list[dict]):
+            await ack_entries([entry_ids[id(message)] for message in messages])
+
+        try:
+            await process_user_messages(tg_user_id, [message for _, message in user_entries], ack_saved)
+        except Exception as e:
+            # Неподтверждённые записи останутся в списке ожидающих и будут забраны повторно
+            print(f"Ошибка при обработке сообщений пользователя {tg_user_id} из стрима:", e)
+            return
+        await print_user_questions(tg_user_id)
+
+    tasks = [
+        queue_dispatcher.submit(tg_user_id, process_and_ack, user_entries)
+        for tg_user_id, user_entries in by_user.items()
+    ]
+    await asyncio.gather(*tasks)
+
+
+async def consume_message_stream():
+    """
+    Фоновая задача для QUEUE_BACKEND="stream": читает сообщения из группы потребителей Redis Streams.
+
+    Несколько процессов бэкенда делят сообщения между собой, а не обрабатывают одни и те же.
+    Сообщения, не подтверждённые упавшим потребителем, забираются через XAUTOCLAIM.
+    """
+    await ensure_consumer_group()
+    consumer = consumer_name()
+    while True:
+        try:
+            entries = await reclaim_pending_entries(consumer)
+            entries += await read_stream_batch(consumer)
+            if entries:
+                await process_stream_entries(entries)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("Ошибка в потребителе стрима сообщений:", e)
+            await asyncio.sleep(1)
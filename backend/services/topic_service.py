@@ -6,11 +6,15 @@ from repositories.message_repository import update_message_status_as_processed
 from repositories.topic_repository import find_or_create_topic
 
 
-async def handle_topic(entity_data: dict, message_id: UUID, db: AsyncSession,):
-    """Процесс поиска или создания темы, включая запрос к GPT, если тема не найдена."""
+async def handle_topic(entity_data: dict, message_id: UUID, db: AsyncSession,
+                       prefetched: dict[tuple, tuple[str, int]] | None = None):
+    """
+    Процесс поиска или создания темы, включая запрос к GPT, если тема не найдена.
+    prefetched - ответы GPT, полученные заранее prefetch_topic_answers до открытия транзакции.
+    """
     action = entity_data.get("action")
     object_ = entity_data.get("object")
-    topic = await find_or_create_topic(action, object_, message_id, db)
+    topic = await find_or_create_topic(action, object_, message_id, db, prefetched)
 
     # Обновление идентификатора темы в сущности
     theme_id = topic.id if topic else 0
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from core.config import settings
+from models.user_models import UserModel
+from schemas.user_schema import UserSchema
+from utils.after_commit import run_after_commit
+from utils.redis_client import redis_client
+
+
+def _redis_key(telegram_id: int) -> str:
+    return f"user_by_tg:{telegram_id}"
+
+
+class UserCache:
+    """
+    Кэш пользователей по telegram_id для горячего пути обработки сообщений.
+
+    Первый уровень - LRU в памяти процесса со сроком жизни local_ttl (ограничивает устаревание
+    в других воркерах после изменения пользователя), второй - Redis, общий для всех воркеров.
+    Отсутствие пользователя не кэшируется: его могут создать в любой момент.
+    """
+
+    def __init__(self, max_size: int, local_ttl: float, redis_ttl: int):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: OrderedDict[int, tuple[float, UserSchema]] = OrderedDict()
+        self._invalidations: set[asyncio.Task] = set()  # Ссылки на задачи инвалидации, чтобы их не собрал GC
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _remember(self, user: UserSchema):
+        if self.max_size <= 0:
+            return
+        self._local[user.telegram_id] = (time.monotonic() + self.local_ttl, user)
+        self._local.move_to_end(user.telegram_id)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def get(self, telegram_id: int) -> Optional[UserSchema]:
+        """Возвращает пользователя из кэша или None, если его там нет."""
+        cached = self._local.get(telegram_id)
+        if cached is not None:
+            expires_at, user = cached
+            if expires_at > time.monotonic():
+                self._local.move_to_end(telegram_id)
+                self.local_hits += 1
+                return user
+            del self._local[telegram_id]
+
+        try:
+            redis = await redis_client.get_redis()
+            value = await redis.get(_redis_key(telegram_id))
+        except Exception as e:
+            print("Ошибка чтения кэша пользователей из Redis:", e)
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        user = UserSchema.model_validate_json(value)
+        self._remember(user)
+        self.redis_hits += 1
+        return user
+
+    async def set(self, user: UserSchema):
+        """Сохраняет пользователя в оба уровня кэша (после чтения из БД или создания)."""
+        self._remember(user)
+        try:
+            redis = await redis_client.get_redis()
+            await redis.set(_redis_key(user.telegram_id), user.model_dump_json(), ex=self.redis_ttl)
+        except Exception as e:
+            print("Ошибка записи кэша пользователей в Redis:", e)
+
+    async def invalidate(self, telegram_id: int):
+        """Удаляет пользователя из кэша. Вызывать после любого изменения или удаления пользователя."""
+        self._local.pop(telegram_id, None)
+        try:
+            redis = await redis_client.get_redis()
+            await redis.delete(_redis_key(telegram_id))
+        except Exception as e:
+            print("Ошибка инвалидации кэша пользователей в Redis:", e)
+
+    def invalidate_later(self, telegram_id: int):
+        """Запускает инвалидацию в фоне - для синхронных обработчиков событий SQLAlchemy."""
+        task = asyncio.get_running_loop().create_task(self.invalidate(telegram_id))
+        self._invalidations.add(task)
+        task.add_done_callback(self._invalidations.discard)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов."""
+        return {
+            "size": len(self._local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+        }
+
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: UserModel):
+    # Изменения через ORM сбрасывают кэш после коммита, включая прежний telegram_id, если он поменялся.
+    # Массовые update()/delete() в обход ORM должны вызывать user_cache.invalidate сами.
+    history = inspect(target).attrs.telegram_id.history
+    telegram_ids = {target.telegram_id, *history.deleted} - {None}
+    run_after_commit(object_session(target), lambda: [user_cache.invalidate_later(tid) for tid in telegram_ids])
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_LOCAL_TTL, settings.USER_CACHE_REDIS_TTL)
@@ -5,6 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user_models import UserModel
 from schemas.user_schema import UserCreate, UserSchema
+from services.user_cache import user_cache
 
 
 class UserService:
@@ -21,6 +22,7 @@ class UserService:
         await self.db.refresh(user)
         # Возвращаем объект схемы UserSchema, чтобы вернуть валидированные данные
         result = UserSchema.from_orm(user)
+        await user_cache.set(result)
         return result
 
     async def get_user(self, user_id: UUID) -> UserSchema:
@@ -33,14 +35,18 @@ class UserService:
         return None  # Можно обработать случай, когда пользователь не найден
 
     async def get_user_by_tg_id(self, tg_user_id: int) -> UserSchema:
+        # Сначала кэш: связка telegram_id -> пользователь почти не меняется
+        cached = await user_cache.get(tg_user_id)
+        if cached is not None:
+            return cached
         # Находим пользователя по ID
-        # import pdb; pdb.set_trace()
-        print("Checking database session:", self.db)
         result = await self.db.execute(select(UserModel).filter(UserModel.telegram_id == tg_user_id))
         user = result.scalar_one_or_none()
         print('User found:', user)  # Проверка значения user
         if user:
-            return UserSchema.model_validate(user)
+            user_schema = UserSchema.model_validate(user)
+            await user_cache.set(user_schema)
+            return user_schema
         return None  # Можно обработать случай, когда пользователь не найден
 
     async def get_all_users(self) -> List[UserSchema]:
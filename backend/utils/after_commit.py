@@ -0,0 +1,54 @@
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+# Ключ в Session.info, где копятся действия до фиксации транзакции вместе с транзакцией, в которой их добавили
+_SESSION_CALLBACKS_KEY = "after_commit_callbacks"
+
+
+def run_after_commit(db: AsyncSession | Session, callback: Callable[[], None]):
+    """
+    Выполняет callback после фиксации транзакции сессии. Используется для обновления кэшей в памяти:
+    до коммита строки могут быть откачены, и кэш сослался бы на несуществующие id.
+    Если callback добавлен внутри точки сохранения и она откачена, он не выполняется.
+    """
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault(_SESSION_CALLBACKS_KEY, []).append((transaction, callback))
+
+
+def _started_inside(transaction: Optional[SessionTransaction], savepoint: SessionTransaction) -> bool:
+    """Добавлен ли callback в транзакции savepoint или во вложенной в неё точке сохранения."""
+    while transaction is not None:
+        if transaction is savepoint:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, "after_commit")
+def _run_callbacks(session: Session):
+    # Срабатывает и при освобождении точки сохранения: действия ждут фиксации внешней транзакции
+    if session.in_nested_transaction():
+        return
+    for _, callback in session.info.pop(_SESSION_CALLBACKS_KEY, []):
+        try:
+            callback()
+        except Exception as e:
+            print("Ошибка действия после коммита:", e)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_callbacks(session: Session, previous_transaction: SessionTransaction):
+    if not previous_transaction.nested:
+        session.info.pop(_SESSION_CALLBACKS_KEY, None)
+        return
+    # Откат точки сохранения отменяет только то, что было сделано внутри неё
+    callbacks = session.info.get(_SESSION_CALLBACKS_KEY)
+    if callbacks:
+        callbacks[:] = [
+            (transaction, callback) for transaction, callback in callbacks
+            if not _started_inside(transaction, previous_transaction)
+        ]
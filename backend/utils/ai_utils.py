@@ -1,20 +1,56 @@
 # backend/utils/ai_utils.py
-import openai
 import asyncio
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
 from core.config import settings
 
 
-openai.api_key = settings.OPENAI_API_CHAT_KEY
+# Общий асинхронный клиент с пулом соединений, создаётся при первом запросе
+_client: Optional[AsyncOpenAI] = None
+# Ограничение одновременных запросов к OpenAI на процесс
+_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Возвращает общий асинхронный клиент OpenAI. OPENAI_BASE_URL позволяет направить его на локальную заглушку."""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_CHAT_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONCURRENCY,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONCURRENCY,
+                ),
+            ),
+        )
+    return _client
+
+
+async def close_openai_client():
+    """Закрывает пул соединений клиента OpenAI"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
 
-async def analyze_text(prompt: str):
+async def analyze_text(prompt: str, max_tokens: int = 50):
     """Анализирует текст и выдает результат по промту и количество потраченных токенов"""
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "user", "content": f"{prompt}"}
-        ],
-        max_tokens=50
-    )
+    async with _semaphore:
+        response = await get_openai_client().chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=[
+                {"role": "user", "content": f"{prompt}"}
+            ],
+            max_tokens=max_tokens
+        )
     response_text = response.choices[0].message.content
     token_usage = response.usage.total_tokens
     return response_text, token_usage
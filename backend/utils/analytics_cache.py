@@ -0,0 +1,67 @@
+import json
+from typing import Iterable, Optional
+from uuid import UUID
+
+from core.config import settings
+from utils.redis_client import redis_client
+
+
+def _version_key(user_id: UUID) -> str:
+    # Счётчик версии данных пользователя: запись новых дневных значений увеличивает его.
+    # Без TTL: сброшенный в 0 счётчик мог бы снова дойти до версии, под которой лежит устаревший результат
+    return f"indicator_analytics_version:{user_id}"
+
+
+def _result_key(user_id: UUID, version: int, params: str) -> str:
+    return f"indicator_analytics:{user_id}:{version}:{params}"
+
+
+async def get_analytics_version(user_id: UUID) -> Optional[int]:
+    """Текущая версия данных пользователя или None, если Redis недоступен (тогда кэш не используется)."""
+    try:
+        redis = await redis_client.get_redis()
+        return int(await redis.get(_version_key(user_id)) or 0)
+    except Exception as e:
+        print("Ошибка чтения версии кэша аналитики из Redis:", e)
+        return None
+
+
+async def get_cached_analytics(user_id: UUID, version: int, params: str) -> Optional[list]:
+    """Возвращает закэшированный результат для версии данных и параметров запроса или None."""
+    try:
+        redis = await redis_client.get_redis()
+        value = await redis.get(_result_key(user_id, version, params))
+    except Exception as e:
+        print("Ошибка чтения кэша аналитики из Redis:", e)
+        return None
+    return json.loads(value) if value is not None else None
+
+
+async def cache_analytics(user_id: UUID, version: int, params: str, result: list):
+    """
+    Кэширует результат под версией, прочитанной до запроса к БД: если данные успели измениться,
+    результат ляжет под устаревшую версию и не будет прочитан.
+    """
+    try:
+        redis = await redis_client.get_redis()
+        await redis.set(_result_key(user_id, version, params), json.dumps(result), ex=settings.ANALYTICS_CACHE_TTL)
+    except Exception as e:
+        print("Ошибка записи кэша аналитики в Redis:", e)
+
+
+async def invalidate_user_analytics(user_ids: Iterable[UUID]):
+    """
+    Сбрасывает кэш аналитики пользователей увеличением версии - без перебора ключей по всем диапазонам дат.
+    Вызывать после коммита записи в daily_indicators; старые результаты истекут по TTL.
+    """
+    version_keys = [_version_key(user_id) for user_id in set(user_ids)]
+    if not version_keys:
+        return
+    try:
+        redis = await redis_client.get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in version_keys:
+                pipe.incr(key)
+            await pipe.execute()
+    except Exception as e:
+        print("Ошибка инвалидации кэша аналитики в Redis:", e)
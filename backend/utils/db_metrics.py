@@ -0,0 +1,115 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Счётчик SQL-запросов текущей задачи; None - подсчёт не ведётся
+_statement_counter: ContextVar[Optional[list]] = ContextVar("statement_counter", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statement_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class StatementStats:
+    """Сколько SQL-запросов в среднем уходит на одно обработанное сообщение."""
+
+    def __init__(self):
+        self.messages = 0
+        self.statements = 0
+        self.last_per_message: Optional[float] = None
+
+    def record(self, statements: int, messages: int = 1):
+        self.messages += messages
+        self.statements += statements
+        self.last_per_message = statements / messages
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "statements": self.statements,
+            "avg_per_message": round(self.statements / self.messages, 2) if self.messages else None,
+            "last_per_message": self.last_per_message,
+        }
+
+
+@contextmanager
+def count_statements():
+    """
+    Считает SQL-запросы, выполненные внутри блока в текущей задаче asyncio.
+    Возвращает список из одного элемента - количество доступно после выхода из блока.
+    """
+    counter = [0]
+    token = _statement_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _statement_counter.reset(token)
+
+
+class PoolMetrics:
+    """Ожидание соединений из пула: сколько раз, как долго, сколько раз уходили в overflow и по таймауту."""
+
+    SLOW_CHECKOUT_S = 0.01
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_checkouts = 0  # Ожидание дольше SLOW_CHECKOUT_S - признак нехватки соединений
+        self.overflow_events = 0  # Создано соединений сверх pool_size
+        self.timeouts = 0
+
+    def record_checkout(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > self.SLOW_CHECKOUT_S:
+            self.slow_checkouts += 1
+
+    def stats(self, pool: AsyncAdaptedQueuePool) -> dict:
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": self.checkouts,
+            "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else None,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "slow_checkouts": self.slow_checkouts,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+        }
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который замеряет время получения соединения и выход за pool_size."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def _inc_overflow(self) -> bool:
+        created = super()._inc_overflow()
+        # Счётчик _overflow начинается с -pool_size: положительное значение - соединение сверх pool_size
+        if created and self._overflow > 0:
+            pool_metrics.overflow_events += 1
+        return created
+
+
+message_statement_stats = StatementStats()
+# Общие для всех экземпляров пула: engine.dispose() пересоздаёт пул, счётчики должны сохраниться
+pool_metrics = PoolMetrics()
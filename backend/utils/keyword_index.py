@@ -0,0 +1,160 @@
+import bisect
+from typing import Iterable, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.entity_models import Topic, Keyword
+from utils.after_commit import run_after_commit
+
+# Короче этого префиксы и триграммы дают слишком много ложных совпадений
+_MIN_FUZZY_LENGTH = 4
+
+
+class TopicMatch(NamedTuple):
+    topic_id: int
+    topic_name: str
+    keyword: str
+    confidence: float
+    method: str  # "exact", "prefix" или "fuzzy"
+
+
+def normalize_word(word: str) -> str:
+    """Приводит лемму к виду для сравнения."""
+    return word.strip().lower().replace("ё", "е")
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: str, b: str) -> float:
+    """1 - расстояние Левенштейна, нормированное на длину большего слова."""
+    if a == b:
+        return 1.0
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+class KeywordIndex:
+    """
+    Индекс ключевых слов тем в памяти процесса: точное совпадение, совпадение по префиксу
+    и нечёткое (триграммы + расстояние Левенштейна). Загружается при старте и пополняется
+    после фиксации транзакций, добавивших ключевые слова.
+    """
+
+    def __init__(self, min_confidence: float):
+        self.min_confidence = min_confidence
+        self.loaded = False
+        self._topics: dict[str, tuple[int, str]] = {}  # слово -> (id темы, название)
+        self._sorted_words: list[str] = []
+        self._by_trigram: dict[str, set[str]] = {}
+        self._trigram_counts: dict[str, int] = {}
+
+    async def load(self, db: AsyncSession):
+        """Загружает все ключевые слова одним запросом."""
+        result = await db.execute(select(Keyword.word, Topic.id, Topic.name).join(Topic, Keyword.topic_id == Topic.id))
+        self._topics.clear()
+        self._sorted_words.clear()
+        self._by_trigram.clear()
+        self._trigram_counts.clear()
+        for word, topic_id, topic_name in result.all():
+            self.add(word, topic_id, topic_name)
+        self.loaded = True
+        print(f"Индекс ключевых слов загружен: {len(self._topics)} слов")
+
+    def add(self, word: str, topic_id: int, topic_name: str):
+        """Добавляет ключевое слово темы в индекс."""
+        word = normalize_word(word)
+        if not word:
+            return
+        if word not in self._topics:
+            bisect.insort(self._sorted_words, word)
+            trigrams = _trigrams(word)
+            self._trigram_counts[word] = len(trigrams)
+            for trigram in trigrams:
+                self._by_trigram.setdefault(trigram, set()).add(word)
+        # Первая тема, к которой привязано слово, остаётся основной
+        self._topics.setdefault(word, (topic_id, topic_name))
+
+    def _match(self, keyword: str, confidence: float, method: str) -> TopicMatch:
+        topic_id, topic_name = self._topics[keyword]
+        return TopicMatch(topic_id, topic_name, keyword, confidence, method)
+
+    def _prefix_match(self, word: str) -> Optional[TopicMatch]:
+        best = None
+        # Ключевые слова, начинающиеся с word
+        start = bisect.bisect_left(self._sorted_words, word)
+        for keyword in self._sorted_words[start:start + 20]:
+            if not keyword.startswith(word):
+                break
+            confidence = len(word) / len(keyword)
+            if best is None or confidence > best.confidence:
+                best = self._match(keyword, confidence, "prefix")
+        # Ключевые слова, которые являются началом word
+        for length in range(len(word) - 1, _MIN_FUZZY_LENGTH - 1, -1):
+            if word[:length] in self._topics:
+                confidence = length / len(word)
+                if best is None or confidence > best.confidence:
+                    best = self._match(word[:length], confidence, "prefix")
+                break
+        return best
+
+    def _fuzzy_match(self, word: str) -> Optional[TopicMatch]:
+        word_trigrams = _trigrams(word)
+        shared: dict[str, int] = {}
+        for trigram in word_trigrams:
+            for keyword in self._by_trigram.get(trigram, ()):
+                shared[keyword] = shared.get(keyword, 0) + 1
+        best = None
+        max_distance = 1 - self.min_confidence
+        for keyword, count in shared.items():
+            # Отсекаем кандидатов до дорогого расчёта расстояния: разница длин - нижняя граница расстояния,
+            # малая доля общих триграмм - признак далёкого слова
+            if abs(len(keyword) - len(word)) / max(len(keyword), len(word)) > max_distance:
+                continue
+            if count / (len(word_trigrams) + self._trigram_counts[keyword] - count) < self.min_confidence / 2:
+                continue
+            confidence = _similarity(word, keyword)
+            if best is None or confidence > best.confidence:
+                best = self._match(keyword, confidence, "fuzzy")
+        return best
+
+    def lookup_word(self, word: Optional[str]) -> Optional[TopicMatch]:
+        """Ищет тему для одного слова. Возвращает лучшее совпадение не ниже порога уверенности."""
+        if not word:
+            return None
+        word = normalize_word(word)
+        if word in self._topics:
+            return self._match(word, 1.0, "exact")
+        if len(word) < _MIN_FUZZY_LENGTH:
+            return None
+        candidates = [match for match in (self._prefix_match(word), self._fuzzy_match(word)) if match]
+        best = max(candidates, key=lambda match: match.confidence, default=None)
+        if best and best.confidence >= self.min_confidence:
+            return best
+        return None
+
+    def lookup(self, words: Iterable[Optional[str]]) -> Optional[TopicMatch]:
+        """Ищет тему по нескольким словам (action, object): точные совпадения важнее нечётких."""
+        matches = [match for match in (self.lookup_word(word) for word in words) if match]
+        return max(matches, key=lambda match: match.confidence, default=None)
+
+    def stats(self) -> dict:
+        return {"loaded": self.loaded, "keywords": len(self._topics)}
+
+
+def queue_index_update(db: AsyncSession, words: Iterable[str], topic_id: int, topic_name: str):
+    """Откладывает добавление слов в индекс до фиксации транзакции сессии."""
+    words = [word for word in words if word]
+    run_after_commit(db, lambda: [keyword_index.add(word, topic_id, topic_name) for word in words])
+
+
+keyword_index = KeywordIndex(settings.TOPIC_INDEX_MIN_CONFIDENCE)
@@ -1,27 +1,128 @@
 import json
+import time
+from typing import Iterable, Optional
 
+from core.config import settings
 from utils.redis_client import redis_client
+from utils.stream_queue import add_message_to_stream, add_messages_to_stream
 
+# Время тишины (в секундах), после которого очередь пользователя отправляется на обработку
+QUEUE_TIMER_TTL = 10
+# Сортированное множество пользователей с очередями, score - момент, когда очередь пора обработать
+QUEUE_SCHEDULE_KEY = "user_queue_schedule"
 
-async def add_message_to_queue(tg_user_id: int, message_id: int, text: str, timestamp: float):
-    """Добавляет сообщение в очередь с таймером истечения"""
-    redis = await redis_client.get_redis()
-    queue_key = f"user_queue:{tg_user_id}"
-    message_data = json.dumps({
+
+# Атомарно забирает из головы очереди не более ARGV[1] сообщений (все, если ARGV[1] <= 0)
+# и удаляет их из списка. Сообщения, добавленные во время выполнения, не теряются.
+_DRAIN_QUEUE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local items
+if limit > 0 then
+    items = redis.call('LRANGE', KEYS[1], 0, limit - 1)
+else
+    items = redis.call('LRANGE', KEYS[1], 0, -1)
+end
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return items
+"""
+_drain_queue_script = None
+
+# Атомарно забирает из расписания до ARGV[2] пользователей, чьё время уже наступило (score <= ARGV[1]).
+# Каждого пользователя получает ровно один воркер.
+_POP_DUE_USERS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+_pop_due_users_script = None
+
+
+def _queue_key(tg_user_id: int) -> str:
+    return f"user_queue:{tg_user_id}"
+
+
+def _timer_key(tg_user_id: int) -> str:
+    return f"user_timer:{tg_user_id}"
+
+
+def _schedule_timer(pipe, tg_user_id: int):
+    """Добавляет в пайплайн перезапуск таймера тишины пользователя"""
+    if settings.QUEUE_SCHEDULER == "zset":
+        pipe.zadd(QUEUE_SCHEDULE_KEY, {str(tg_user_id): time.time() + QUEUE_TIMER_TTL})
+    else:
+        pipe.set(_timer_key(tg_user_id), "active", ex=QUEUE_TIMER_TTL)
+
+
+def _serialize_message(message_id: int, text: str, timestamp: float) -> str:
+    return json.dumps({
         "message_id": message_id,
         "text": text,
         "timestamp": timestamp,
     })
-    await redis.rpush(queue_key, message_data)
-    await redis.set(f"user_timer:{tg_user_id}", "active", ex=10)
 
 
-async def fetch_and_clear_user_queue(tg_user_id: int):
-    """Извлекает все сообщения из очереди и очищает её"""
+async def add_message_to_queue(tg_user_id: int, message_id: int, text: str, timestamp: float):
+    """Добавляет сообщение в очередь с таймером истечения за один атомарный запрос к Redis"""
+    if settings.QUEUE_BACKEND == "stream":
+        return await add_message_to_stream(tg_user_id, message_id, text, timestamp)
+    redis = await redis_client.get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(_queue_key(tg_user_id), _serialize_message(message_id, text, timestamp))
+        _schedule_timer(pipe, tg_user_id)
+        await pipe.execute()
+
+
+async def add_messages_to_queue(messages: Iterable[dict]) -> int:
+    """
+    Добавляет пачку сообщений (возможно, от разных пользователей) в очереди одним пайплайном.
+
+    Каждое сообщение - словарь с ключами tg_user_id, message_id, text, timestamp.
+    Сообщения одного пользователя добавляются одной командой RPUSH в исходном порядке,
+    таймер пользователя обновляется один раз. Возвращает количество добавленных сообщений.
+    """
+    if settings.QUEUE_BACKEND == "stream":
+        return await add_messages_to_stream(messages)
+    grouped: dict[int, list[str]] = {}
+    for message in messages:
+        grouped.setdefault(message["tg_user_id"], []).append(
+            _serialize_message(message["message_id"], message["text"], message["timestamp"])
+        )
+    if not grouped:
+        return 0
+
+    redis = await redis_client.get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        for tg_user_id, payloads in grouped.items():
+            pipe.rpush(_queue_key(tg_user_id), *payloads)
+            _schedule_timer(pipe, tg_user_id)
+        await pipe.execute()
+    return sum(len(payloads) for payloads in grouped.values())
+
+
+async def fetch_and_clear_user_queue(tg_user_id: int, max_batch: Optional[int] = None) -> list[dict]:
+    """
+    Атомарно извлекает сообщения из очереди пользователя и удаляет их за один запрос к Redis.
+
+    Если задан max_batch, извлекается не более max_batch самых старых сообщений,
+    остальные остаются в очереди для следующего вызова. Возвращает декодированные сообщения.
+    """
+    global _drain_queue_script
+    redis = await redis_client.get_redis()
+    if _drain_queue_script is None:
+        _drain_queue_script = redis.register_script(_DRAIN_QUEUE_SCRIPT)
+    messages = await _drain_queue_script(keys=[_queue_key(tg_user_id)], args=[max_batch or 0])
+    return [json.loads(msg) for msg in messages]
+
+
+async def pop_due_users(limit: int = 500) -> list[int]:
+    """Забирает из расписания пользователей, у которых истёк таймер тишины, одним запросом к Redis"""
+    global _pop_due_users_script
     redis = await redis_client.get_redis()
-    queue_key = f"user_queue:{tg_user_id}"
-    messages = await redis.lrange(queue_key, 0, -1)
-    await redis.delete(queue_key)
-    result = [json.loads(msg) for msg in messages]
-    print('RESULT', result)
-    return result
\ No newline at end of file
+    if _pop_due_users_script is None:
+        _pop_due_users_script = redis.register_script(_POP_DUE_USERS_SCRIPT)
+    due = await _pop_due_users_script(keys=[QUEUE_SCHEDULE_KEY], args=[time.time(), limit])
+    return [int(tg_user_id) for tg_user_id in due]
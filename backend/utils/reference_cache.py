@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.entity_models import EntityRequirement
+from models.message_models import PromptModel
+from utils.redis_client import redis_client
+
+# Канал Redis, через который воркеры сообщают друг другу об изменении справочных таблиц
+INVALIDATION_CHANNEL = "reference_data_invalidated"
+
+
+class RequirementSnapshot(NamedTuple):
+    id: int
+    action: Optional[str]
+    object: Optional[str]
+    required_fields: list[str]
+    questions: dict
+
+    @classmethod
+    def from_model(cls, requirement: EntityRequirement) -> "RequirementSnapshot":
+        return cls(
+            id=requirement.id,
+            action=requirement.action,
+            object=requirement.object,
+            required_fields=list(requirement.required_fields or []),
+            questions=dict(requirement.questions or {}),
+        )
+
+
+class ReferenceDataCache:
+    """
+    Снимок таблиц prompts и entity_requirements в памяти процесса.
+
+    Загружается при старте и целиком перечитывается по сообщению "all" в канале INVALIDATION_CHANNEL
+    или раз в max_age секунд. Новые требования добавляются в снимок после коммита и рассылаются
+    остальным воркерам. Промах снимка не означает отсутствия строки - вызывающий код читает БД.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._prompts: dict[str, str] = {}
+        self._requirements: dict[tuple, RequirementSnapshot] = {}
+        self._instance_id = uuid.uuid4().hex  # Свои сообщения из канала не обрабатываем
+        self._publishes: set[asyncio.Task] = set()  # Ссылки на задачи публикации, чтобы их не собрал GC
+
+    async def load(self, db: AsyncSession):
+        """Перечитывает обе таблицы и атомарно подменяет снимок."""
+        prompts = (await db.execute(select(PromptModel.name, PromptModel.content))).all()
+        requirements = (await db.execute(select(EntityRequirement))).scalars().all()
+        self._prompts = {name: content for name, content in prompts}
+        self._requirements = {(r.action, r.object): RequirementSnapshot.from_model(r) for r in requirements}
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+        print(f"Справочные данные загружены: {len(self._prompts)} промтов, {len(self._requirements)} требований")
+
+    def get_prompt(self, name: str) -> Optional[str]:
+        return self._prompts.get(name)
+
+    def put_prompt(self, name: str, content: str):
+        self._prompts[name] = content
+
+    def get_requirement(self, action: Optional[str], object_: Optional[str]) -> Optional[RequirementSnapshot]:
+        return self._requirements.get((action, object_))
+
+    def put_requirement(self, requirement: EntityRequirement) -> RequirementSnapshot:
+        """Кладёт прочитанное из БД требование в снимок."""
+        snapshot = RequirementSnapshot.from_model(requirement)
+        self._requirements[(snapshot.action, snapshot.object)] = snapshot
+        return snapshot
+
+    def forget_requirement(self, action: Optional[str], object_: Optional[str]):
+        self._requirements.pop((action, object_), None)
+
+    def publish_requirement_change(self, action: Optional[str], object_: Optional[str]):
+        """Сообщает остальным воркерам, что требование для пары изменилось. Вызывается после коммита."""
+        self._start_publish(json.dumps({
+            "kind": "requirement", "action": action, "object": object_, "sender": self._instance_id,
+        }))
+
+    async def invalidate_all(self):
+        """Просит все воркеры, включая текущий, перечитать справочные таблицы (после ручной правки в БД)."""
+        await self._publish(json.dumps({"kind": "all"}))
+
+    def _start_publish(self, message: str):
+        task = asyncio.get_running_loop().create_task(self._publish(message))
+        self._publishes.add(task)
+        task.add_done_callback(self._publishes.discard)
+
+    async def _publish(self, message: str):
+        try:
+            redis = await redis_client.get_redis()
+            await redis.publish(INVALIDATION_CHANNEL, message)
+        except Exception as e:
+            print("Ошибка публикации инвалидации справочных данных:", e)
+
+    async def _handle_message(self, data: bytes, reload: Callable):
+        message = json.loads(data)
+        if message.get("sender") == self._instance_id:
+            return
+        if message.get("kind") == "requirement":
+            # Следующее обращение к паре прочитает актуальную строку из БД
+            self.forget_requirement(message.get("action"), message.get("object"))
+        else:
+            await reload()
+
+    async def listen(self, session_maker):
+        """Фоновая задача: слушает канал инвалидации и перечитывает снимок по сообщениям и по возрасту."""
+        async def reload():
+            async with session_maker() as db:
+                await self.load(db)
+
+        while True:
+            pubsub = None
+            try:
+                redis = await redis_client.get_redis()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Пока не были подписаны, сообщения могли потеряться - перечитываем снимок
+                await reload()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        await self._handle_message(message["data"], reload)
+                    if time.monotonic() - self.loaded_at > self.max_age:
+                        await reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Ошибка подписки на инвалидацию справочных данных:", e)
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "prompts": len(self._prompts),
+            "requirements": len(self._requirements),
+            "age_s": round(time.monotonic() - self.loaded_at, 1) if self.loaded else None,
+        }
+
+
+reference_cache = ReferenceDataCache(settings.REFERENCE_CACHE_MAX_AGE)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from utils.redis_client import redis_client
+
+# Снимает блокировку, только если она всё ещё принадлежит нам
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые вызовы в один.
+
+    Внутри процесса повторные вызовы с тем же ключом ждут уже выполняющийся. Между процессами
+    первый захватывает блокировку в Redis и публикует результат, остальные дожидаются его.
+    Результат должен сериализоваться в JSON. do() возвращает (результат, выполнял ли вызов этот код).
+    """
+
+    def __init__(self, namespace: str, lock_ttl: float = 30.0, result_ttl: int = 60,
+                 wait_timeout: float = 30.0, poll_interval: float = 0.1):
+        self.namespace = namespace
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._release_script = None
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight), False
+
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку забирают ожидающие; если их нет, не засоряем лог предупреждением
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result, is_leader = await self._do_shared(key, func)
+            future.set_result(result)
+            return result, is_leader
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _do_shared(self, key: str, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        result_key = f"{self.namespace}:result:{key}"
+        lock_key = f"{self.namespace}:lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = False
+        try:
+            redis = await redis_client.get_redis()
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                cached = await redis.get(result_key)
+                if cached is not None:
+                    return json.loads(cached), False
+                if await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                    acquired = True
+                    break
+                await asyncio.sleep(self.poll_interval)
+            else:
+                print(f"Не дождались результата {lock_key}, выполняем сами")
+        except Exception as e:
+            # Redis недоступен - работаем без межпроцессного объединения
+            print("Ошибка single-flight в Redis:", e)
+        if not acquired:
+            return await func(), True
+
+        try:
+            result = await func()
+            try:
+                await redis.set(result_key, json.dumps(result, ensure_ascii=False), ex=self.result_ttl)
+            except Exception as e:
+                print("Ошибка публикации результата single-flight:", e)
+            return result, True
+        finally:
+            try:
+                if self._release_script is None:
+                    self._release_script = redis.register_script(_RELEASE_LOCK_SCRIPT)
+                await self._release_script(keys=[lock_key], args=[token])
+            except Exception as e:
+                print("Ошибка снятия блокировки single-flight:", e)
@@ -0,0 +1,167 @@
+import json
+import os
+import socket
+from typing import Iterable
+
+from redis.exceptions import ResponseError
+
+from core.config import settings
+from utils.redis_client import redis_client
+
+
+def consumer_name() -> str:
+    """Уникальное имя потребителя для текущего процесса бэкенда"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _stream_fields(tg_user_id: int, message_id: int, text: str, timestamp: float) -> dict:
+    return {
+        "tg_user_id": tg_user_id,
+        "payload": json.dumps({
+            "message_id": message_id,
+            "text": text,
+            "timestamp": timestamp,
+        }),
+    }
+
+
+def _decode_id(entry_id) -> str:
+    return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+
+def _decode_entries(entries) -> list[tuple[str, int | None, dict | None]]:
+    """Преобразует ответ XREADGROUP/XAUTOCLAIM в список (entry_id, tg_user_id, message)"""
+    result = []
+    for entry_id, fields in entries:
+        entry_id = _decode_id(entry_id)
+        # Запись могла быть удалена из стрима (MAXLEN), но остаться в списке ожидающих
+        if not fields:
+            result.append((entry_id, None, None))
+            continue
+        result.append((entry_id, int(fields[b"tg_user_id"]), json.loads(fields[b"payload"])))
+    return result
+
+
+async def ensure_consumer_group():
+    """Создаёт стрим и группу потребителей, если их ещё нет"""
+    redis = await redis_client.get_redis()
+    try:
+        await redis.xgroup_create(settings.QUEUE_STREAM_KEY, settings.QUEUE_STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def add_message_to_stream(tg_user_id: int, message_id: int, text: str, timestamp: float):
+    """Добавляет сообщение пользователя в общий стрим очереди"""
+    redis = await redis_client.get_redis()
+    await redis.xadd(
+        settings.QUEUE_STREAM_KEY,
+        _stream_fields(tg_user_id, message_id, text, timestamp),
+        maxlen=settings.QUEUE_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+async def add_messages_to_stream(messages: Iterable[dict]) -> int:
+    """Добавляет пачку сообщений в стрим одним пайплайном, сохраняя их порядок"""
+    redis = await redis_client.get_redis()
+    added = 0
+    async with redis.pipeline(transaction=True) as pipe:
+        for message in messages:
+            pipe.xadd(
+                settings.QUEUE_STREAM_KEY,
+                _stream_fields(message["tg_user_id"], message["message_id"], message["text"], message["timestamp"]),
+                maxlen=settings.QUEUE_STREAM_MAXLEN,
+                approximate=True,
+            )
+            added += 1
+        if added:
+            await pipe.execute()
+    return added
+
+
+async def read_stream_batch(consumer: str) -> list[tuple[str, int | None, dict | None]]:
+    """Читает новые сообщения группы для потребителя, блокируясь до QUEUE_STREAM_BLOCK_MS"""
+    redis = await redis_client.get_redis()
+    response = await redis.xreadgroup(
+        settings.QUEUE_STREAM_GROUP,
+        consumer,
+        streams={settings.QUEUE_STREAM_KEY: ">"},
+        count=settings.QUEUE_MAX_BATCH,
+        block=settings.QUEUE_STREAM_BLOCK_MS,
+    )
+    if not response:
+        return []
+    _, entries = response[0]
+    return _decode_entries(entries)
+
+
+# Позиция, с которой XAUTOCLAIM продолжит просмотр списка ожидающих, для каждого потребителя процесса
+_reclaim_cursors: dict[str, str] = {}
+
+
+async def reclaim_pending_entries(consumer: str) -> list[tuple[str, int | None, dict | None]]:
+    """
+    Забирает себе сообщения, которые другой потребитель получил, но не подтвердил
+    дольше QUEUE_STREAM_CLAIM_IDLE_MS (например, после падения процесса).
+
+    Просмотр продолжается с позиции, которую вернул предыдущий вызов, и доходит до конца списка ожидающих
+    прежде, чем начаться заново. Сообщения, доставленные больше QUEUE_STREAM_MAX_DELIVERIES раз, не возвращаются,
+    а переносятся в QUEUE_STREAM_DEAD_LETTER_KEY: ошибка в них повторялась бы бесконечно.
+    """
+    redis = await redis_client.get_redis()
+    response = await redis.xautoclaim(
+        settings.QUEUE_STREAM_KEY,
+        settings.QUEUE_STREAM_GROUP,
+        consumer,
+        min_idle_time=settings.QUEUE_STREAM_CLAIM_IDLE_MS,
+        start_id=_reclaim_cursors.get(consumer, "0-0"),
+        count=settings.QUEUE_MAX_BATCH,
+    )
+    next_id, entries = response[0], response[1]
+    _reclaim_cursors[consumer] = _decode_id(next_id)
+    if not entries:
+        return []
+    return _decode_entries(await _dead_letter_exhausted(redis, consumer, entries))
+
+
+async def _dead_letter_exhausted(redis, consumer: str, entries: list) -> list:
+    """Переносит в стрим отказов записи, исчерпавшие число доставок, и возвращает остальные"""
+    # XAUTOCLAIM уже увеличил счётчик доставок забранных записей
+    pending = await redis.xpending_range(
+        settings.QUEUE_STREAM_KEY,
+        settings.QUEUE_STREAM_GROUP,
+        min=entries[0][0],
+        max=entries[-1][0],
+        count=len(entries),
+        consumername=consumer,
+    )
+    deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+    exhausted = [
+        (entry_id, fields) for entry_id, fields in entries
+        if fields and deliveries.get(entry_id, 0) > settings.QUEUE_STREAM_MAX_DELIVERIES
+    ]
+    if not exhausted:
+        return entries
+    async with redis.pipeline(transaction=True) as pipe:
+        for entry_id, fields in exhausted:
+            pipe.xadd(
+                settings.QUEUE_STREAM_DEAD_LETTER_KEY,
+                {**fields, b"entry_id": entry_id, b"deliveries": deliveries[entry_id]},
+                maxlen=settings.QUEUE_STREAM_MAXLEN,
+                approximate=True,
+            )
+        pipe.xack(settings.QUEUE_STREAM_KEY, settings.QUEUE_STREAM_GROUP, *[entry_id for entry_id, _ in exhausted])
+        await pipe.execute()
+    exhausted_ids = {entry_id for entry_id, _ in exhausted}
+    print(f"В стрим отказов перенесено {len(exhausted)} сообщений:", [_decode_id(entry_id) for entry_id, _ in exhausted])
+    return [(entry_id, fields) for entry_id, fields in entries if entry_id not in exhausted_ids]
+
+
+async def ack_entries(entry_ids: list[str]):
+    """Подтверждает обработку сообщений стрима"""
+    if not entry_ids:
+        return
+    redis = await redis_client.get_redis()
+    await redis.xack(settings.QUEUE_STREAM_KEY, settings.QUEUE_STREAM_GROUP, *entry_ids)
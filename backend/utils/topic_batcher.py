@@ -0,0 +1,147 @@
+import asyncio
+import json
+import re
+from typing import Optional
+
+from core.config import settings
+from utils.ai_utils import analyze_text
+
+# Сколько токенов ответа закладываем на один набор слов в общем запросе
+_TOKENS_PER_ITEM = 20
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def split_tokens(total: int, parts: int) -> list[int]:
+    """Делит потраченные токены между запросами так, чтобы сумма совпала с общим расходом."""
+    share, rest = divmod(total, parts)
+    return [share + (1 if i < rest else 0) for i in range(parts)]
+
+
+def build_batch_prompt(define_prompt: str, keyword_sets: list[list[str]]) -> str:
+    """Собирает один запрос на определение тем для нескольких наборов ключевых слов."""
+    lines = [f"{i}. По словам {', '.join(keywords)}." for i, keywords in enumerate(keyword_sets, start=1)]
+    return (
+        f"{define_prompt}\n"
+        "Выполни это задание отдельно для каждого пункта ниже. Ответь только JSON-объектом, "
+        "где ключ - номер пункта, а значение - ответ для этого пункта, например {\"1\": \"...\", \"2\": \"False\"}.\n"
+        + "\n".join(lines)
+    )
+
+
+def parse_batch_response(response_text: str, count: int) -> Optional[list[str]]:
+    """Разбирает JSON-ответ на общий запрос. Возвращает None, если ответ не удалось разобрать."""
+    match = _JSON_OBJECT.search(response_text or "")
+    if not match:
+        return None
+    try:
+        answers = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(answers, dict):
+        return None
+    result = []
+    for i in range(1, count + 1):
+        answer = answers.get(str(i))
+        if answer is None:
+            return None
+        result.append("False" if answer is False else str(answer))
+    return result
+
+
+class TopicBatcher:
+    """
+    Собирает запросы на определение темы за короткое окно (window_ms или max_items наборов)
+    и отправляет их в GPT одним запросом. Каждый вызывающий получает свой ответ и долю токенов.
+    Вызывающий, который держит открытую транзакцию, передаёт flush_now: пачка уходит сразу,
+    вместе с уже собранными запросами, без ожидания окна.
+    """
+
+    def __init__(self, window_ms: int, max_items: int):
+        self.window_ms = window_ms
+        self.max_items = max_items
+        self._pending: dict[str, tuple[list[str], list[asyncio.Future]]] = {}
+        self._define_prompt: Optional[str] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: set[asyncio.Task] = set()  # Ссылки на отправляемые пачки, чтобы задачи не собрал GC
+        self.requests_sent = 0
+        self.items_classified = 0
+
+    async def classify(self, keywords: list[str], define_prompt: str, flush_now: bool = False) -> tuple[str, int]:
+        """Возвращает (ответ GPT для набора слов, доля потраченных токенов)."""
+        key = "|".join(sorted(keywords))
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, (keywords, []))[1].append(future)
+        self._define_prompt = define_prompt
+
+        if flush_now or len(self._pending) >= self.max_items:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window_ms / 1000)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._flush(list(batch.values()), self._define_prompt))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[tuple[list[str], list[asyncio.Future]]], define_prompt: str):
+        try:
+            answers = await self._classify_batch([keywords for keywords, _ in batch], define_prompt)
+            for (_, futures), (answer, tokens) in zip(batch, answers):
+                for future, share in zip(futures, split_tokens(tokens, len(futures))):
+                    if not future.done():
+                        future.set_result((answer, share))
+        except Exception as e:
+            self._fail(batch, e)
+        finally:
+            # Отправка отменена (например, при остановке приложения) - ожидающие не должны висеть вечно
+            self._fail(batch, RuntimeError("Запрос на определение темы отменён"))
+
+    @staticmethod
+    def _fail(batch: list[tuple[list[str], list[asyncio.Future]]], error: Exception):
+        for _, futures in batch:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _classify_batch(self, keyword_sets: list[list[str]], define_prompt: str) -> list[tuple[str, int]]:
+        if len(keyword_sets) == 1:
+            self.requests_sent += 1
+            self.items_classified += 1
+            return [await analyze_text(f"По словам {', '.join(keyword_sets[0])}. {define_prompt}")]
+
+        prompt = build_batch_prompt(define_prompt, keyword_sets)
+        response_text, token_usage = await analyze_text(prompt, max_tokens=_TOKENS_PER_ITEM * len(keyword_sets) + 20)
+        self.requests_sent += 1
+        answers = parse_batch_response(response_text, len(keyword_sets))
+        shares = split_tokens(token_usage, len(keyword_sets))
+        if answers is not None:
+            self.items_classified += len(keyword_sets)
+            return list(zip(answers, shares))
+
+        # Ответ не разобрался - спрашиваем по каждому набору отдельно, потраченные токены всё равно учитываем
+        print(f"Не удалось разобрать пакетный ответ GPT: {response_text}")
+        single = await asyncio.gather(*[
+            self._classify_batch([keywords], define_prompt) for keywords in keyword_sets
+        ])
+        return [(answer[0][0], answer[0][1] + share) for answer, share in zip(single, shares)]
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "requests_sent": self.requests_sent,
+            "items_classified": self.items_classified,
+        }
+
+
+topic_batcher = TopicBatcher(settings.TOPIC_BATCH_WINDOW_MS, settings.TOPIC_BATCH_MAX_ITEMS)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from typing import Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from utils.after_commit import run_after_commit
+from utils.redis_client import redis_client
+
+# Маркер закэшированного отрицательного ответа (пара не относится ни к одной теме)
+NO_TOPIC = {"id": None, "name": None}
+
+# Ссылки на фоновые задачи инвалидации, чтобы их не собрал GC
+_invalidations: set[asyncio.Task] = set()
+
+
+def _pair_key(action: Optional[str], object_: Optional[str]) -> str:
+    return f"topic_resolution:{action or ''}:{object_ or ''}"
+
+
+def _word_key(word: str) -> str:
+    # Множество ключей кэша, в которых участвует слово - для точечной инвалидации
+    return f"topic_resolution_words:{word}"
+
+
+async def get_cached_topic(action: Optional[str], object_: Optional[str]) -> Optional[dict]:
+    """
+    Возвращает закэшированный результат для пары action/object: {"id", "name"} темы,
+    NO_TOPIC для отрицательного ответа или None, если в кэше ничего нет.
+    """
+    try:
+        redis = await redis_client.get_redis()
+        value = await redis.get(_pair_key(action, object_))
+    except Exception as e:
+        print("Ошибка чтения кэша тем из Redis:", e)
+        return None
+    if value is None:
+        return None
+    return json.loads(value)
+
+
+async def cache_topic(action: Optional[str], object_: Optional[str], topic_id: Optional[int], topic_name: Optional[str]):
+    """Кэширует тему для пары action/object. topic_id=None означает отрицательный ответ с коротким TTL."""
+    key = _pair_key(action, object_)
+    ttl = settings.TOPIC_CACHE_TTL if topic_id is not None else settings.TOPIC_NEGATIVE_CACHE_TTL
+    try:
+        redis = await redis_client.get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, json.dumps({"id": topic_id, "name": topic_name}), ex=ttl)
+            for word in {action, object_}:
+                if word:
+                    pipe.sadd(_word_key(word), key)
+                    pipe.expire(_word_key(word), settings.TOPIC_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        print("Ошибка записи кэша тем в Redis:", e)
+
+
+async def invalidate_topic_cache(words: Iterable[str]):
+    """Удаляет из кэша все пары, содержащие любое из слов, у которых изменилась привязка к темам."""
+    word_keys = [_word_key(word) for word in set(words) if word]
+    if not word_keys:
+        return
+    try:
+        redis = await redis_client.get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for word_key in word_keys:
+                pipe.smembers(word_key)
+            members = await pipe.execute()
+        keys = set(word_keys)
+        for pair_keys in members:
+            keys.update(pair_keys)
+        await redis.delete(*keys)
+    except Exception as e:
+        print("Ошибка инвалидации кэша тем в Redis:", e)
+
+
+def queue_topic_cache_invalidation(db: AsyncSession, words: Iterable[str]):
+    """
+    Откладывает инвалидацию кэша тем до фиксации транзакции сессии: иначе другой воркер между инвалидацией
+    и коммитом закэширует ответ, прочитанный из БД без новых слов.
+    """
+    words = [word for word in words if word]
+
+    def start():
+        task = asyncio.get_running_loop().create_task(invalidate_topic_cache(words))
+        _invalidations.add(task)
+        task.add_done_callback(_invalidations.discard)
+
+    run_after_commit(db, start)
@@ -0,0 +1,122 @@
+"""
+Сравнение нового извлечения сущностей с прежним на примерах из "sample text Nutrition bot.rtf".
+
+Проверяет, что результаты совпадают, и печатает время обоих вариантов.
+Запуск из каталога backend (нужны переменные окружения бэкенда и модель ru_core_news_sm):
+
+    python ../tests/backend/bench_entity_extraction.py
+"""
+import os
+import re
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.entity_service import get_nlp, _entities_from_doc, quantity_units, size_indicators  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "..", "sample text Nutrition bot.rtf")
+ROUNDS = 200
+
+
+def load_corpus() -> list[str]:
+    """Достаёт строки примеров из RTF-файла."""
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        raw = f.read()
+    body = raw[raw.index("\\strokec2") + len("\\strokec2"):]
+    body = re.sub(r"\\uc0", "", body)
+    body = re.sub(r"\\u(\d+) ?", lambda m: chr(int(m.group(1))), body)
+    lines = [line.strip(" \\}\n") for line in body.split("\\\n")]
+    return [line for line in lines if line]
+
+
+def legacy_entities_from_doc(doc) -> dict:
+    """Прежняя реализация: регулярные выражения по всему тексту на каждом токене."""
+    text = doc.text
+    entities = {
+        "action": None,
+        "object": None,
+        "specific_object": None,
+        "location": None,
+        "quantity": None,
+        "size": None,
+        "conditions": None,
+        "duration": None,
+        "time": None,
+        "date": None,
+    }
+
+    for i, token in enumerate(doc):
+        if token.pos_ == "VERB" and not entities["action"]:
+            entities["action"] = token.lemma_
+
+        if token.pos_ == "NOUN":
+            prev_token = doc[i - 1] if i > 0 else None
+            next_token = doc[i + 1] if i + 1 < len(doc) else None
+
+            if token.lemma_ in size_indicators and not entities["size"]:
+                entities["size"] = token.text
+                if next_token and next_token.pos_ == "NOUN":
+                    entities["object"] = next_token.lemma_
+
+            elif not entities["object"] and token.lemma_ not in size_indicators:
+                entities["object"] = token.lemma_
+
+            if prev_token and prev_token.pos_ == "ADJ" and not entities["specific_object"]:
+                entities["specific_object"] = f"{prev_token.lemma_} {token.lemma_}"
+
+        if token.lemma_ in quantity_units:
+            next_token = doc[i + 1] if i + 1 < len(doc) else None
+            if next_token and next_token.pos_ == "NOUN":
+                entities["object"] = next_token.lemma_
+                entities["quantity"] = token.text
+                if i + 2 < len(doc) and doc[i + 2].lemma_ == "без":
+                    entities["specific_object"] = f"{next_token.lemma_} без {doc[i + 3].lemma_}"
+
+        time_match = re.search(r"\b\d{1,2}[:.]\d{2}\b", text)
+        if time_match:
+            entities["time"] = time_match.group(0)
+
+        duration_match = re.search(r"\b\d+\s?(минут|час)\b", text)
+        if duration_match:
+            entities["duration"] = duration_match.group(0)
+
+        if token.ent_type_ == "LOC" or token.ent_type_ == "GPE":
+            entities["location"] = token.text
+
+    if entities["size"] and not entities["object"]:
+        entities["size"] = None
+
+    return entities
+
+
+def measure(func, docs) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for doc in docs:
+            func(doc)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    texts = load_corpus()
+    # Разбор spaCy одинаков для обоих вариантов, сравниваем только стадию правил
+    docs = list(get_nlp().pipe(texts))
+
+    for text, doc in zip(texts, docs):
+        expected = legacy_entities_from_doc(doc)
+        actual = _entities_from_doc(doc)
+        assert actual == expected, f"Расхождение для '{text}': {actual} != {expected}"
+    print(f"Результаты совпадают на {len(docs)} примерах")
+
+    legacy_ms = measure(legacy_entities_from_doc, docs)
+    compiled_ms = measure(_entities_from_doc, docs)
+    total = ROUNDS * len(docs)
+    print(f"Прежняя стадия правил:      {legacy_ms:8.1f} мс ({legacy_ms / total * 1000:.1f} мкс на сообщение)")
+    print(f"Скомпилированная стадия:    {compiled_ms:8.1f} мс ({compiled_ms / total * 1000:.1f} мкс на сообщение)")
+    print(f"Ускорение: {legacy_ms / compiled_ms:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Сравнение поиска темы в индексе ключевых слов в памяти с прежним запросом JOIN к БД.
+
+Берёт ключевые слова из таблицы keywords, ищет по ним тему обоими способами, проверяет,
+что точные совпадения индекса дают ту же тему, и печатает время обоих вариантов.
+Запуск из каталога backend (нужны переменные окружения бэкенда и заполненная таблица keywords):
+
+    python ../tests/backend/bench_keyword_index.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import select, or_  # noqa: E402
+
+from db.session import async_session_maker, engine  # noqa: E402
+from models.entity_models import Topic, Keyword  # noqa: E402
+# Связанные модели должны быть импортированы до первого запроса
+from models import user_models, indicators_models, message_models  # noqa: E402,F401
+from utils.keyword_index import KeywordIndex  # noqa: E402
+
+LOOKUPS = 500
+
+
+def distort(word: str) -> str:
+    """Имитирует другую словоформу: меняет окончание слова."""
+    return word[:-1] + "ы" if len(word) > 4 else word
+
+
+async def sql_lookup(db, action, object_):
+    """Прежний запрос из find_or_create_topic."""
+    results = await db.execute(
+        select(Topic)
+        .join(Keyword, Keyword.topic_id == Topic.id)
+        .where(or_(Keyword.word == action, Keyword.word == object_))
+    )
+    return results.scalars().all()
+
+
+async def main():
+    async with async_session_maker() as db:
+        index = KeywordIndex(min_confidence=0.8)
+        started = time.perf_counter()
+        await index.load(db)
+        print(f"Загрузка индекса: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        words = list((await db.execute(select(Keyword.word))).scalars().all())
+        if not words:
+            print("Таблица keywords пуста, сравнивать нечего")
+            return
+        pairs = [(random.choice(words), random.choice(words)) for _ in range(LOOKUPS)]
+
+        started = time.perf_counter()
+        sql_results = [await sql_lookup(db, action, object_) for action, object_ in pairs]
+        sql_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index_results = [index.lookup(pair) for pair in pairs]
+        index_time = time.perf_counter() - started
+
+        for (action, object_), topics, match in zip(pairs, sql_results, index_results):
+            assert match is not None, (action, object_)
+            assert match.topic_id in {topic.id for topic in topics}, (action, object_, match)
+
+        fuzzy_pairs = [(distort(action), distort(object_)) for action, object_ in pairs]
+        started = time.perf_counter()
+        fuzzy_found = sum(index.lookup(pair) is not None for pair in fuzzy_pairs)
+        fuzzy_time = time.perf_counter() - started
+        sql_fuzzy_found = 0
+        for action, object_ in fuzzy_pairs:
+            sql_fuzzy_found += bool(await sql_lookup(db, action, object_))
+
+    await engine.dispose()
+    print(f"Поисков: {LOOKUPS}, ключевых слов в индексе: {index.stats()['keywords']}")
+    print(f"JOIN в БД:        {sql_time * 1000:.1f} мс ({sql_time / LOOKUPS * 1e6:.0f} мкс на поиск)")
+    print(f"Индекс (точный):  {index_time * 1000:.1f} мс ({index_time / LOOKUPS * 1e6:.0f} мкс на поиск)")
+    print(f"Индекс (другие словоформы): {fuzzy_time * 1000:.1f} мс, "
+          f"найдено {fuzzy_found} из {LOOKUPS} (JOIN находит {sql_fuzzy_found})")
+    print(f"Ускорение точного поиска: {sql_time / index_time:.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Общие настройки тестов бэкенда: модули backend импортируются как в приложении (from core.config import ...).
+
+Тесты, которым нужна настоящая Postgres, берут её адрес из DATABASE_URL и пропускаются, если он не задан.
+Каждый такой тест работает в своей временной схеме и не трогает таблицы приложения.
+"""
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, BACKEND_DIR)
+
+# Адрес настоящей БД запоминается до подстановки заглушек, которые нужны только для импорта настроек
+POSTGRES_URL = os.environ.get("DATABASE_URL", "")
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://postgres@localhost/postgres")
+os.environ.setdefault("SYNC_DATABASE_URL", "postgresql+psycopg2://postgres@localhost/postgres")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+
+@pytest.fixture(scope="session")
+def postgres_url() -> str:
+    if not POSTGRES_URL.startswith("postgresql"):
+        pytest.skip("DATABASE_URL с Postgres не задан")
+    return POSTGRES_URL
+
+
+@pytest.fixture(scope="session")
+def isolated_schema(postgres_url):
+    """
+    Фабрика асинхронного контекста: движок, у которого search_path указывает на новую схему
+    со всеми таблицами моделей. Схема удаляется при выходе из контекста.
+    """
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from db.base import Base
+    from models import user_models, indicators_models, message_models, entity_models  # noqa: F401
+
+    @asynccontextmanager
+    async def make(schema: str):
+        engine = create_async_engine(postgres_url, connect_args={"server_settings": {"search_path": schema}})
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {schema}"))
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            yield engine
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await engine.dispose()
+
+    return make
@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from utils.after_commit import run_after_commit
+
+
+def make_session() -> Session:
+    session = Session(create_engine("sqlite://"))
+    session.execute(text("SELECT 1"))
+    return session
+
+
+def test_runs_after_commit():
+    session, done = make_session(), []
+    run_after_commit(session, lambda: done.append("a"))
+    assert done == []
+    session.commit()
+    assert done == ["a"]
+    session.commit()
+    assert done == ["a"]
+
+
+def test_discarded_on_rollback():
+    session, done = make_session(), []
+    run_after_commit(session, lambda: done.append("a"))
+    with session.begin_nested():
+        run_after_commit(session, lambda: done.append("b"))
+    session.rollback()
+    session.commit()
+    assert done == []
+
+
+def test_savepoint_rollback_keeps_outer_callbacks():
+    session, done = make_session(), []
+    run_after_commit(session, lambda: done.append("outer"))
+    savepoint = session.begin_nested()
+    run_after_commit(session, lambda: done.append("inner"))
+    savepoint.rollback()
+    session.commit()
+    assert done == ["outer"]
+
+
+def test_savepoint_release_waits_for_outer_commit():
+    session, done = make_session(), []
+    with session.begin_nested():
+        run_after_commit(session, lambda: done.append("inner"))
+    assert done == []
+    session.commit()
+    assert done == ["inner"]
+
+
+def test_rollback_of_enclosing_savepoint_drops_nested_callbacks():
+    session, done = make_session(), []
+    outer = session.begin_nested()
+    run_after_commit(session, lambda: done.append("first"))
+    with session.begin_nested():
+        run_after_commit(session, lambda: done.append("second"))
+    outer.rollback()
+    with session.begin_nested():
+        run_after_commit(session, lambda: done.append("third"))
+    session.commit()
+    assert done == ["third"]
+
+
+def test_failing_callback_does_not_stop_others():
+    session, done = make_session(), []
+    run_after_commit(session, lambda: 1 / 0)
+    run_after_commit(session, lambda: done.append("a"))
+    session.commit()
+    assert done == ["a"]
@@ -0,0 +1,32 @@
+import pytest
+
+from services.entity_cache import EntityCache, normalize_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Выпил  чашку\tкофе\n", "Выпил чашку кофе"),
+    ("  «Съел тарелку супа»!!! ", "Съел тарелку супа"),
+    ("...Гулял 30 минут в парке?", "Гулял 30 минут в парке"),
+    ("Проснулся в 7:30", "Проснулся в 7:30"),
+    ("Обед в 13.15 - суп", "Обед в 13.15 - суп"),
+    ("", ""),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_normalize_text_keeps_case():
+    # Место распознаётся по заглавной букве, и quantity/size берутся из текста токенов как есть
+    assert normalize_text("Гулял в Москве") != normalize_text("гулял в москве")
+    assert normalize_text("Гулял в Москве") == "Гулял в Москве"
+
+
+def test_normalize_text_is_idempotent():
+    text = " — Выпил 2 стакана воды без газа… "
+    assert normalize_text(normalize_text(text)) == normalize_text(text)
+
+
+def test_cache_key_keeps_case():
+    cache = EntityCache(max_size=10, use_redis=False, redis_ttl=60)
+    assert cache._key("Гулял в Москве.") == cache._key(" Гулял  в Москве ")
+    assert cache._key("Гулял в Москве") != cache._key("гулял в москве")
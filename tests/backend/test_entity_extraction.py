@@ -0,0 +1,67 @@
+"""
+Скомпилированная стадия правил (_entities_from_doc) должна давать те же сущности, что прежняя реализация.
+Нужна модель ru_core_news_sm; без неё тесты пропускаются.
+"""
+import pytest
+
+spacy = pytest.importorskip("spacy")
+if not spacy.util.is_package("ru_core_news_sm"):
+    pytest.skip("модель ru_core_news_sm не установлена", allow_module_level=True)
+
+from services.entity_service import get_nlp, _entities_from_doc  # noqa: E402
+
+from .bench_entity_extraction import legacy_entities_from_doc, load_corpus  # noqa: E402
+
+nlp = get_nlp()
+
+MESSAGES = [
+    # Количество: единица измерения и существительное (QUANTITY)
+    "Выпил чашку кофе",
+    "Выкурил сигарету",
+    "Выпил два стакана воды",
+    # Количество с уточнением через "без" (QUANTITY_WITHOUT)
+    "Выпил чашку кофе без сахара",
+    "Выпил литр молока без лактозы.",
+    "Выпил два стакана воды без газа после тренировки",
+    # Размер и объект
+    "Съел тарелку горохового супа",
+    "Съел большую порцию каши",
+    "Съел миску",
+    "Съел тарелку, потом выпил стакан сока",
+    # Время и продолжительность
+    "Проснулся в 7:30 утра",
+    "Обед в 13.15, потом гулял 30 минут",
+    "Спал 8 час",
+    "Пробежка 45минут в 6:05",
+    # Место
+    "Съел тарелку супа в Москве",
+    "Гулял по Санкт-Петербургу 2 часа",
+    # Пустые и вырожденные сообщения
+    "",
+    "без",
+    "чашку",
+]
+
+
+@pytest.mark.parametrize("text", MESSAGES)
+def test_matches_legacy_extraction(text):
+    doc = nlp(text)
+    assert _entities_from_doc(doc) == legacy_entities_from_doc(doc)
+
+
+def test_matches_legacy_extraction_on_corpus():
+    texts = load_corpus()
+    for text, doc in zip(texts, nlp.pipe(texts)):
+        assert _entities_from_doc(doc) == legacy_entities_from_doc(doc), text
+
+
+def test_without_at_end_of_message():
+    # Прежняя реализация падала с IndexError, обращаясь к токену после "без" в конце сообщения
+    doc = nlp("Выпил чашку кофе без")
+    with pytest.raises(IndexError):
+        legacy_entities_from_doc(doc)
+
+    entities = _entities_from_doc(doc)
+    assert entities["quantity"] == "чашку"
+    assert entities["object"] == "кофе"
+    assert entities["specific_object"] is None
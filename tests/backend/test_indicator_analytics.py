@@ -0,0 +1,133 @@
+import math
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from schemas.indicators_schema import IndicatorAnalyticsSchema
+from services.indicator_analytics import _buckets, _rolling_mean, compute_series_analytics
+
+
+def naive_analytics(dates: list, values: list, window: int, streak_since: date) -> dict:
+    """Те же показатели простыми циклами по дням - эталон для векторизованного расчёта."""
+    valid = [(d, v) for d, v in zip(dates, values) if v is not None]
+    rolling = []
+    for d in dates:
+        window_values = [v for vd, v in valid if d - timedelta(days=window) < vd <= d]
+        rolling.append(sum(window_values) / len(window_values) if window_values else None)
+    delta, previous = [], None
+    for v in values:
+        delta.append(v - previous if v is not None and previous is not None else None)
+        if v is not None:
+            previous = v
+
+    def buckets(key):
+        groups = {}
+        for d, v in valid:
+            groups.setdefault(key(d), []).append(v)
+        return {
+            "start": [k.isoformat() for k in groups],
+            "sum": [sum(g) for g in groups.values()],
+            "avg": [sum(g) / len(g) for g in groups.values()],
+            "min": [min(g) for g in groups.values()],
+            "max": [max(g) for g in groups.values()],
+            "count": [len(g) for g in groups.values()],
+        }
+
+    runs = []
+    for i, (d, _) in enumerate(valid):
+        if i and (d - valid[i - 1][0]).days == 1:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+    if valid:
+        streak = {"current": runs[-1] if valid[-1][0] >= streak_since else 0, "longest": max(runs),
+                  "last_date": valid[-1][0].isoformat()}
+    else:
+        streak = {"current": 0, "longest": 0, "last_date": None}
+    return {
+        "series": {"date": [d.isoformat() for d in dates], "value": values, "rolling_avg": rolling, "delta": delta},
+        "weekly": buckets(lambda d: d - timedelta(days=d.weekday())),
+        "monthly": buckets(lambda d: d.replace(day=1)),
+        "streak": streak,
+        "total_change": valid[-1][1] - valid[0][1] if valid else None,
+    }
+
+
+def assert_close(actual, expected, path="result"):
+    if isinstance(expected, dict):
+        assert actual.keys() == expected.keys(), path
+        for key in expected:
+            assert_close(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected), path
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            assert_close(a, e, f"{path}[{i}]")
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-9, abs=1e-9), path
+    else:
+        assert actual == expected, path
+
+
+def as_arrays(dates: list, values: list) -> tuple[np.ndarray, np.ndarray]:
+    return np.array(dates, dtype="datetime64[D]"), np.array(values, dtype=np.float64)
+
+
+def test_matches_naive_reference_on_random_series():
+    rng = np.random.default_rng(25)
+    start = date(2024, 1, 1)
+    for _ in range(200):
+        size = int(rng.integers(0, 90))
+        offsets = sorted(set(rng.integers(0, 150, size).tolist()))
+        dates = [start + timedelta(days=offset) for offset in offsets]
+        values = [None if rng.random() < 0.15 else round(float(rng.normal(50, 20)), 2) for _ in dates]
+        window = int(rng.integers(1, 31))
+        streak_since = start + timedelta(days=int(rng.integers(0, 160)))
+
+        actual = compute_series_analytics(*as_arrays(dates, values), window, streak_since)
+        assert_close(actual, naive_analytics(dates, values, window, streak_since))
+
+
+def test_rolling_mean_skips_missing_days_and_values():
+    dates, values = as_arrays(
+        [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 5), date(2024, 1, 6)], [1.0, None, 3.0, 5.0],
+    )
+    result = _rolling_mean(dates.astype("int64"), values, 3)
+    assert result[0] == 1.0
+    assert result[1] == 1.0  # 2 января без значения: среднее по 1 января
+    assert math.isnan(_rolling_mean(dates[:2].astype("int64"), np.array([np.nan, np.nan]), 3)[1])
+    assert result[2] == 3.0  # 1 и 2 января за пределами окна из трёх дней
+    assert result[3] == 4.0
+
+
+def test_buckets_group_consecutive_keys():
+    keys = np.array(["2024-01-01", "2024-01-01", "2024-01-08", "2024-02-05"], dtype="datetime64[D]")
+    result = _buckets(keys, np.array([1.0, 3.0, 2.0, 4.0]))
+    assert result == {
+        "start": ["2024-01-01", "2024-01-08", "2024-02-05"],
+        "sum": [4.0, 2.0, 4.0],
+        "avg": [2.0, 2.0, 4.0],
+        "min": [1.0, 2.0, 4.0],
+        "max": [3.0, 2.0, 4.0],
+        "count": [2, 1, 1],
+    }
+    assert _buckets(keys[:0], np.array([]))["count"] == []
+
+
+@pytest.mark.parametrize("streak_since, current", [
+    (date(2024, 1, 3), 3),  # серия доходит до конца периода
+    (date(2024, 1, 4), 0),  # последнее значение записано раньше - серия прервана
+])
+def test_current_streak_requires_recent_last_day(streak_since, current):
+    dates, values = as_arrays([date(2024, 1, day) for day in range(1, 4)], [1.0, 2.0, 3.0])
+    streak = compute_series_analytics(dates, values, 7, streak_since)["streak"]
+    assert streak == {"current": current, "longest": 3, "last_date": "2024-01-03"}
+
+
+def test_result_matches_response_schema():
+    dates, values = as_arrays([date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 9)], [1.0, None, 2.5])
+    result = compute_series_analytics(dates, values, 7, date(2024, 1, 9))
+    schema = IndicatorAnalyticsSchema.model_validate({"indicator_id": str(uuid.uuid4()), **result})
+    assert schema.streak.current == 1
+    assert schema.series.value == [1.0, None, 2.5]
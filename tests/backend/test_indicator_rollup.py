@@ -0,0 +1,116 @@
+"""
+Окна инкрементальной агрегации замеров: каждое начинается с первого замера после отметки и не длиннее
+window_hours, свежие замеры моложе lag не берутся; заданное вручную значение агрегация не заменяет.
+Нужна Postgres из DATABASE_URL.
+"""
+import asyncio
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from models.indicators_models import (
+    DailyIndicatorModel, IndicatorCollectionModel, IndicatorModel, RollupWatermarkModel,
+)
+from models.user_models import UserModel
+from schemas.indicators_schema import DailyIndicatorCreate
+from services.indicator_rollup import DailyRollup, ROLLUP_NAME
+from services.indicator_service import DailyIndicatorService
+
+SCHEMA = "rollup_check"
+
+
+def test_rollup_windows_follow_watermark(isolated_schema):
+    user_id, indicator_id = uuid.uuid4(), uuid.uuid4()
+    collections = [
+        (datetime(2024, 1, 1, 10, 0), 4.0),
+        (datetime(2024, 1, 1, 10, 30), None),  # замер без значения учитывается, но не входит в агрегаты
+        (datetime(2024, 1, 1, 12, 0), 8.0),  # тот же день, следующее окно - складывается с первым
+        (datetime(2024, 1, 2, 9, 0), 5.0),
+    ]
+
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            async with session_maker() as db:
+                async with db.begin():
+                    db.add(UserModel(id=user_id, telegram_id=1, username="user"))
+                    db.add(IndicatorModel(id=indicator_id, name="вода", measurement_type="мл", theme="питание"))
+                    await db.flush()
+                    await db.execute(insert(IndicatorCollectionModel), [
+                        {"user_id": user_id, "indicator_id": indicator_id, "collection_time": time, "value": value}
+                        for time, value in collections
+                    ])
+                    # Значение без агрегатов, не отмеченное как ручное (записано до агрегации), заменяется средним
+                    await db.execute(insert(DailyIndicatorModel).values(
+                        user_id=user_id, indicator_id=indicator_id, date=date(2024, 1, 2), value=100.0))
+                    # Свежий замер моложе lag ждёт следующего запуска
+                    await db.execute(insert(IndicatorCollectionModel).values(
+                        user_id=user_id, indicator_id=indicator_id, collection_time=func.localtimestamp(), value=1.0))
+
+            rollup = DailyRollup(lag=60, window_hours=1)
+            batches = await rollup.run(session_maker)
+            async with session_maker() as db:
+                daily = (await db.scalars(select(DailyIndicatorModel).order_by(DailyIndicatorModel.date))).all()
+                watermark = await db.scalar(
+                    select(RollupWatermarkModel.watermark).where(RollupWatermarkModel.name == ROLLUP_NAME))
+            return batches, daily, watermark, rollup.stats()
+
+    batches, daily, watermark, stats = asyncio.run(main())
+    assert [(b["window_start"], b["watermark"], b["collections"], b["daily_rows"]) for b in batches] == [
+        (datetime(2024, 1, 1, 10, 0), datetime(2024, 1, 1, 11, 0), 2, 1),
+        (datetime(2024, 1, 1, 12, 0), datetime(2024, 1, 1, 13, 0), 1, 1),
+        (datetime(2024, 1, 2, 9, 0), datetime(2024, 1, 2, 10, 0), 1, 1),
+    ]
+    assert watermark == datetime(2024, 1, 2, 10, 0)
+    assert [(d.date, d.value, d.value_sum, d.value_min, d.value_max, d.value_count) for d in daily] == [
+        (date(2024, 1, 1), 6.0, 12.0, 4.0, 8.0, 2),
+        (date(2024, 1, 2), 5.0, 5.0, 5.0, 5.0, 1),
+    ]
+    assert stats["batches"] == 3 and stats["collections"] == 4
+
+
+def test_rollup_without_collections_does_nothing(isolated_schema):
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            async with session_maker() as db:
+                return await DailyRollup(lag=60, window_hours=24).run_batch(db)
+
+    assert asyncio.run(main()) is None
+
+
+def test_manual_value_survives_rollup(isolated_schema):
+    user_id, indicator_id = uuid.uuid4(), uuid.uuid4()
+
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            async with session_maker() as db:
+                async with db.begin():
+                    db.add(UserModel(id=user_id, telegram_id=1, username="user"))
+                    db.add(IndicatorModel(id=indicator_id, name="вода", measurement_type="мл", theme="питание"))
+                    await db.flush()
+                    await db.execute(insert(IndicatorCollectionModel), [
+                        {"user_id": user_id, "indicator_id": indicator_id, "collection_time": time, "value": value}
+                        for time, value in [(datetime(2024, 1, 1, 10, 0), 4.0), (datetime(2024, 1, 1, 12, 0), 8.0)]
+                    ])
+            rollup = DailyRollup(lag=60, window_hours=1)
+            async with session_maker() as db:
+                await rollup.run_batch(db)  # Первое окно: день уже агрегирован до ручной правки
+            async with session_maker() as db:
+                manual = await DailyIndicatorService(db).upsert_daily_indicator(
+                    DailyIndicatorCreate(user_id=user_id, date=date(2024, 1, 1), indicator_id=indicator_id, value=100.0))
+            await rollup.run(session_maker)
+            async with session_maker() as db:
+                daily = await db.scalar(select(DailyIndicatorModel))
+            return manual, daily
+
+    manual, daily = asyncio.run(main())
+    assert (manual.value, manual.is_manual, manual.value_count) == (100.0, True, 1)
+    # Замер после ручной правки учтён в агрегатах, значение осталось ручным
+    assert (daily.value, daily.is_manual, daily.value_sum, daily.value_min, daily.value_max, daily.value_count) == (
+        100.0, True, 12.0, 4.0, 8.0, 2,
+    )
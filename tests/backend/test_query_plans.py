@@ -0,0 +1,129 @@
+"""
+Планы запросов горячего пути: ни один не должен читать проиндексированные таблицы последовательным сканированием.
+
+Во временной схеме создаются таблицы с индексами из моделей и заполняются данными, затем вызываются
+функции репозиториев; выполненные ими запросы перехватываются и прогоняются через EXPLAIN.
+Нужна Postgres из DATABASE_URL; Redis не обязателен - кэши при его недоступности пропускаются.
+"""
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from models.entity_models import EntityModel
+from models.message_models import MessageModel
+from repositories.entity_repository import (
+    check_missing_data_and_ask_questions, find_or_create_entity_requirement, get_entity_requirement,
+    update_entity_theme_id,
+)
+from repositories.message_repository import update_message_token_usage
+from repositories.topic_repository import add_keywords_to_topic, create_topic_with_keywords, resolve_topic
+from schemas.message_schema import MessageUpdate
+from services.user_service import UserService
+
+SCHEMA = "query_plan_check"
+ROWS = 50_000
+EXPLAINABLE = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+CHECKED_TABLES = {"users", "messages", "entities", "entity_requirements", "topics", "keywords", "prompts"}
+
+SEED_SQL = [
+    f"""INSERT INTO users (id, telegram_id, username, is_active, created_at)
+        SELECT gen_random_uuid(), g, 'user' || g, true, now() FROM generate_series(1, {ROWS // 10}) g""",
+    f"""INSERT INTO topics (id, name) SELECT g, 'тема ' || g FROM generate_series(1, {ROWS // 50}) g""",
+    f"""SELECT setval(pg_get_serial_sequence('topics', 'id'), {ROWS // 50})""",
+    f"""INSERT INTO keywords (word, topic_id)
+        SELECT 'слово' || g, 1 + g % {ROWS // 50} FROM generate_series(1, {ROWS}) g""",
+    f"""INSERT INTO entity_requirements (action, object, required_fields, questions)
+        SELECT 'действие' || g, 'объект' || g, ARRAY['quantity'], '{{"quantity": "Сколько?"}}'::json
+        FROM generate_series(1, {ROWS // 10}) g""",
+    f"""INSERT INTO messages (id, user_id, text, timestamp, is_processed)
+        SELECT gen_random_uuid(), u.id, 'сообщение', now() - g * interval '1 minute', false
+        FROM generate_series(1, {ROWS}) g JOIN LATERAL (
+            SELECT id FROM users WHERE telegram_id = 1 + g % {ROWS // 10}) u ON true""",
+    f"""INSERT INTO entities (message_id, action, object)
+        SELECT id, 'действие' || (row_number() OVER () % {ROWS // 10}), 'объект' || (row_number() OVER () % {ROWS // 10})
+        FROM messages""",
+]
+
+# Запросы горячего пути: имя -> вызов с сессией, сообщением и сущностью из заполненных таблиц
+QUERIES = {
+    "пользователь по telegram_id": lambda db, message, entity: UserService(db).get_user_by_tg_id(42),
+    "требования по action/object": lambda db, message, entity: get_entity_requirement("действие7", "объект7", db),
+    "тема по ключевым словам": lambda db, message, entity: resolve_topic("слово123", "слово456", db),
+    "ключевые слова темы": lambda db, message, entity: add_keywords_to_topic(1, ["слово1"], db),
+    "вставка требования с ON CONFLICT":
+        lambda db, message, entity: find_or_create_entity_requirement("действие", None, db),
+    "вставка темы с ON CONFLICT": lambda db, message, entity: create_topic_with_keywords("тема 7", ["слово7"], db),
+    "токены сообщения":
+        lambda db, message, entity: update_message_token_usage(db, MessageUpdate(id=message.id, token_usage=1)),
+    "тема сущности": lambda db, message, entity: update_entity_theme_id(db, entity.message_id, 1),
+    "недостающие данные": lambda db, message, entity: check_missing_data_and_ask_questions(entity.message_id, db),
+    # Чтения, для которых ещё нет функции в репозиториях, но которые покрывают новые индексы
+    "история сообщений пользователя": lambda db, message, entity: db.execute(
+        select(MessageModel).where(MessageModel.user_id == message.user_id)
+        .order_by(MessageModel.timestamp.desc()).limit(50)),
+    "сущности по action/object": lambda db, message, entity: db.execute(
+        select(EntityModel).where(EntityModel.action == "действие7", EntityModel.object == "объект7")),
+}
+
+
+def seq_scans(plan: dict) -> list[str]:
+    """Проверяемые таблицы, которые план читает последовательным сканированием."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def collect_plans(make_schema) -> dict:
+    """Имя запроса -> список (SQL, таблицы с Seq Scan) для каждой выполненной им команды."""
+    plans = {}
+    async with make_schema(SCHEMA) as engine:
+        captured: list = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            # Точки сохранения и прочие служебные команды EXPLAIN не принимает
+            if statement.split(None, 1)[0].upper() in EXPLAINABLE:
+                captured.append((statement, parameters))
+
+        async with engine.begin() as conn:
+            for sql in SEED_SQL:
+                await conn.execute(text(sql))
+            await conn.execute(text("ANALYZE"))
+
+        session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        async with session_maker() as db:
+            message = (await db.execute(select(MessageModel).limit(1))).scalar_one()
+            entity = (await db.execute(select(EntityModel).limit(1))).scalar_one()
+            for name, query in QUERIES.items():
+                captured.clear()
+                await query(db, message, entity)
+                statements = list(captured)
+                plans[name] = []
+                for statement, parameters in statements:
+                    connection = await db.connection()
+                    rows = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                    plan = rows.scalar()
+                    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+                    plans[name].append((" ".join(statement.split()), seq_scans(plan)))
+            await db.rollback()
+    return plans
+
+
+@pytest.fixture(scope="module")
+def query_plans(isolated_schema):
+    return asyncio.run(collect_plans(isolated_schema))
+
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_no_seq_scan(query_plans, name):
+    plans = query_plans[name]
+    assert plans, f"{name}: не выполнено ни одного запроса"
+    for statement, scans in plans:
+        assert not scans, f"{name}: Seq Scan по {', '.join(scans)} в {statement[:200]}"
@@ -0,0 +1,97 @@
+import asyncio
+
+from services.queue_dispatcher import UserQueueDispatcher
+
+
+async def settle():
+    # Даём задачам дойти до ожидания
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_tasks_of_one_user_run_in_order():
+    events = []
+
+    async def handler(tg_user_id, number, delay):
+        events.append(("start", number))
+        await asyncio.sleep(delay)
+        events.append(("end", number))
+
+    async def main():
+        dispatcher = UserQueueDispatcher(max_concurrency=4)
+        # Первая задача самая долгая: без очереди пользователя вторая и третья закончились бы раньше
+        tasks = [dispatcher.submit(1, handler, number, delay) for number, delay in [(1, 0.05), (2, 0.01), (3, 0)]]
+        await asyncio.gather(*tasks)
+        return dispatcher.stats()
+
+    stats = asyncio.run(main())
+    assert events == [("start", 1), ("end", 1), ("start", 2), ("end", 2), ("start", 3), ("end", 3)]
+    assert stats == {"max_concurrency": 4, "in_flight": 0, "waiting": 0, "users": 0}
+
+
+def test_different_users_overlap_up_to_limit():
+    running, peak = set(), []
+
+    async def main():
+        dispatcher = UserQueueDispatcher(max_concurrency=2)
+        release = asyncio.Event()
+
+        async def handler(tg_user_id):
+            running.add(tg_user_id)
+            peak.append(len(running))
+            await release.wait()
+            running.discard(tg_user_id)
+
+        tasks = [dispatcher.submit(tg_user_id, handler) for tg_user_id in range(1, 5)]
+        await settle()
+        during = dispatcher.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return during, dispatcher.stats()
+
+    during, after = asyncio.run(main())
+    assert max(peak) == 2
+    assert len(peak) == 4
+    assert during == {"max_concurrency": 2, "in_flight": 2, "waiting": 2, "users": 4}
+    assert after == {"max_concurrency": 2, "in_flight": 0, "waiting": 0, "users": 0}
+
+
+def test_failed_task_does_not_break_user_chain():
+    calls = []
+
+    async def failing(tg_user_id):
+        calls.append("failing")
+        raise RuntimeError("ошибка обработки")
+
+    async def handler(tg_user_id):
+        calls.append("next")
+
+    async def main():
+        dispatcher = UserQueueDispatcher(max_concurrency=2)
+        tasks = [dispatcher.submit(1, failing), dispatcher.submit(1, handler)]
+        # Ошибка обработчика логируется, задача диспетчера завершается без исключения
+        await asyncio.gather(*tasks)
+        return dispatcher.stats()
+
+    stats = asyncio.run(main())
+    assert calls == ["failing", "next"]
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0 and stats["users"] == 0
+
+
+def test_stats_count_task_waiting_for_previous_one():
+    async def main():
+        dispatcher = UserQueueDispatcher(max_concurrency=4)
+        release = asyncio.Event()
+
+        async def handler(tg_user_id):
+            await release.wait()
+
+        tasks = [dispatcher.submit(1, handler), dispatcher.submit(1, handler), dispatcher.submit(2, handler)]
+        await settle()
+        # Второй задаче пользователя 1 слот есть, но она ждёт первую
+        during = dispatcher.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return during
+
+    assert asyncio.run(main()) == {"max_concurrency": 4, "in_flight": 2, "waiting": 1, "users": 2}
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from utils import topic_batcher as batcher_module
+from utils.topic_batcher import TopicBatcher
+
+
+def fake_analyze_text(calls: list, delay: float = 0.0):
+    async def analyze_text(prompt, max_tokens=None):
+        calls.append(prompt)
+        await asyncio.sleep(delay)
+        if max_tokens is None:
+            return "Еда", 10
+        count = prompt.count("По словам")
+        return "{" + ", ".join(f'"{i}": "Тема {i}"' for i in range(1, count + 1)) + "}", 30
+    return analyze_text
+
+
+def test_requests_in_window_go_in_one_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batcher_module, "analyze_text", fake_analyze_text(calls))
+
+    async def main():
+        batcher = TopicBatcher(window_ms=50, max_items=10)
+        return await asyncio.gather(
+            batcher.classify(["выпить", "кофе"], "Определи тему."),
+            batcher.classify(["съесть", "суп"], "Определи тему."),
+            batcher.classify(["выпить", "кофе"], "Определи тему."),
+        ), batcher.stats()
+
+    results, stats = asyncio.run(main())
+    assert len(calls) == 1
+    assert [answer for answer, _ in results] == ["Тема 1", "Тема 2", "Тема 1"]
+    assert sum(tokens for _, tokens in results) == 30
+    assert stats == {"pending": 0, "requests_sent": 1, "items_classified": 2}
+
+
+def test_flush_now_does_not_wait_for_window(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batcher_module, "analyze_text", fake_analyze_text(calls))
+
+    async def main():
+        batcher = TopicBatcher(window_ms=10_000, max_items=10)
+        return await asyncio.wait_for(batcher.classify(["выпить", "кофе"], "Определи тему.", flush_now=True), 1)
+
+    assert asyncio.run(main()) == ("Еда", 10)
+    assert len(calls) == 1
+
+
+def test_cancelled_flush_fails_pending_futures(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batcher_module, "analyze_text", fake_analyze_text(calls, delay=10))
+
+    async def main():
+        batcher = TopicBatcher(window_ms=0, max_items=10)
+        waiting = asyncio.create_task(batcher.classify(["выпить", "кофе"], "Определи тему."))
+        while not calls:
+            await asyncio.sleep(0.01)
+        for task in list(batcher._flushes):
+            task.cancel()
+        return await asyncio.wait_for(waiting, 1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Поиск-или-создание через INSERT ... ON CONFLICT: повторные и одновременные вызовы из разных сессий
+сходятся к одной строке. Нужна Postgres из DATABASE_URL.
+"""
+import asyncio
+import uuid
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from models.entity_models import EntityRequirement, Keyword, Topic
+from repositories.entity_repository import find_or_create_entity_requirement
+from repositories.topic_repository import add_keywords_to_topic, create_topic_with_keywords
+
+SCHEMA = "upsert_check"
+CONCURRENCY = 8
+
+
+def unique(prefix: str) -> str:
+    # Снимок справочных данных общий для процесса - у каждого теста свои значения
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+async def in_new_session(session_maker, func, *args):
+    async with session_maker() as db:
+        async with db.begin():
+            return await func(*args, db)
+
+
+def test_entity_requirement_upsert(isolated_schema):
+    action = unique("выпить")
+
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            created = await asyncio.gather(*[
+                in_new_session(session_maker, find_or_create_entity_requirement, action, None)
+                for _ in range(CONCURRENCY)
+            ])
+            again = await in_new_session(session_maker, find_or_create_entity_requirement, action, None)
+            other = await in_new_session(session_maker, find_or_create_entity_requirement, action, "кофе")
+            async with session_maker() as db:
+                rows = await db.scalar(select(func.count()).select_from(EntityRequirement)
+                                       .where(EntityRequirement.action == action))
+            return created, again, other, rows
+
+    created, again, other, rows = asyncio.run(main())
+    assert len({requirement.id for requirement in created}) == 1
+    assert again.id == created[0].id
+    assert (again.action, again.object) == (action, None)
+    assert other.id != again.id
+    assert rows == 2
+
+
+def test_topic_and_keywords_upsert(isolated_schema):
+    name, words = unique("тема"), [unique("кофе"), unique("чай")]
+
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            topics = await asyncio.gather(*[
+                in_new_session(session_maker, create_topic_with_keywords, name, words)
+                for _ in range(CONCURRENCY)
+            ])
+            new_word = unique("сок")
+            await in_new_session(session_maker, add_keywords_to_topic, topics[0].id,
+                                 [words[0], new_word, new_word, None])
+            async with session_maker() as db:
+                topic_count = await db.scalar(select(func.count()).select_from(Topic).where(Topic.name == name))
+                keywords = (await db.scalars(select(Keyword.word).where(Keyword.topic_id == topics[0].id))).all()
+            return topics, topic_count, keywords, new_word
+
+    topics, topic_count, keywords, new_word = asyncio.run(main())
+    assert len({topic.id for topic in topics}) == 1
+    assert topic_count == 1
+    assert sorted(keywords) == sorted(words + [new_word])
+
+
+def test_entity_requirement_upsert_with_generic_plan(isolated_schema):
+    # Начиная с шестого выполнения подготовленного запроса на соединении Postgres переходит на общий план;
+    # force_generic_plan включает его сразу. Выражение ON CONFLICT должно совпадать с индексом и в нём
+    actions = [unique("действие") for _ in range(8)]
+
+    async def main():
+        async with isolated_schema(SCHEMA) as engine:
+            session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            async with session_maker() as db:
+                async with db.begin():
+                    await db.execute(text("SET LOCAL plan_cache_mode = force_generic_plan"))
+                    created = [await find_or_create_entity_requirement(action, None, db) for action in actions]
+                    # Снимок справочных данных пополняется после коммита - повторный поиск идёт в БД
+                    again = [await find_or_create_entity_requirement(action, None, db) for action in actions]
+            return created, again
+
+    created, again = asyncio.run(main())
+    assert [requirement.id for requirement in again] == [requirement.id for requirement in created]